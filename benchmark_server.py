@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Compara el throughput del arranque actual (un solo proceso uvicorn) con el
+launcher de producción (gunicorn + gunicorn_conf.py).
+
+Uso:
+    python benchmark_server.py [--duration 10] [--concurrency 32] [--path /posts]
+
+Cada servidor se inicia en un puerto local, se le envían peticiones GET
+concurrentes durante `--duration` segundos y se imprime req/s y latencias.
+"""
+import argparse
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+COMMANDS = {
+    "uvicorn (1 proceso)": [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", "{port}", "--log-level", "warning",
+    ],
+    "gunicorn (gunicorn_conf.py)": [
+        sys.executable, "-m", "gunicorn", "main:app",
+        "-c", "gunicorn_conf.py", "--bind", "127.0.0.1:{port}",
+        "--log-level", "warning", "--access-logfile", "/dev/null",
+    ],
+}
+
+
+def wait_until_ready(port: int, path: str, timeout: float = 60.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", path)
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def run_load(port: int, path: str, duration: float, concurrency: int) -> dict:
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        local = []
+        local_errors = 0
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    local_errors += 1
+                else:
+                    local.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / duration,
+        "p50": percentile(0.50),
+        "p99": percentile(0.99),
+    }
+
+
+def benchmark(name: str, command: list, port: int, args) -> dict:
+    command = [part.replace("{port}", str(port)) for part in command]
+    # Todos los clientes salen de la misma IP: desactivar el rate limiting
+    env = dict(os.environ, RATE_LIMIT_ENABLED="false")
+    process = subprocess.Popen(
+        command, cwd=script_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True, env=env,
+    )
+    try:
+        if not wait_until_ready(port, args.path):
+            print(f"✗ {name}: el servidor no respondió")
+            return {}
+        # Calentamiento para que todos los workers tengan conexiones abiertas
+        run_load(port, args.path, 1.0, args.concurrency)
+        return run_load(port, args.path, args.duration, args.concurrency)
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de arranque del servidor")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--path", default="/posts")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Benchmark GET {args.path} - {args.concurrency} clientes, {args.duration:.0f}s")
+    print("=" * 60)
+    results = {}
+    for offset, (name, command) in enumerate(COMMANDS.items()):
+        results[name] = benchmark(name, command, args.port + offset, args)
+        r = results[name]
+        if r:
+            print(
+                f"{name:30s} {r['rps']:9.1f} req/s  p50 {r['p50']:7.1f} ms  "
+                f"p99 {r['p99']:7.1f} ms  errores {r['errors']}"
+            )
+
+    base, prod = results.values()
+    if base and prod and base["rps"]:
+        print("-" * 60)
+        print(f"Mejora de throughput: x{prod['rps'] / base['rps']:.2f}")
@@ -1,30 +1,311 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from fastapi import Request, Response
+from typing import Optional
+import math
 import os
+import sqlite3
+import threading
+import time
 from dotenv import load_dotenv
+from jose import JWTError, jwt
+
+import shared_store
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# URL opcional de una réplica de solo lectura (ej: read replica de Neon)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+
+# Segundos que las lecturas de un autor van al primario después de escribir
+READ_STICKY_SECONDS = float(os.getenv("READ_STICKY_SECONDS", "5"))
+# Segundos que la réplica queda descartada después de fallar
+READ_REPLICA_RETRY_SECONDS = float(os.getenv("READ_REPLICA_RETRY_SECONDS", "30"))
+# Intervalo mínimo entre comprobaciones de salud de la réplica
+READ_REPLICA_CHECK_SECONDS = float(os.getenv("READ_REPLICA_CHECK_SECONDS", "10"))
+
+# Conexiones por proceso (pool + overflow). Con varios workers gunicorn_conf.py
+# las reparte para que el total no supere DB_MAX_CONNECTIONS
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
 
 # Si no hay DATABASE_URL, usar SQLite para desarrollo local
 if not DATABASE_URL:
     DATABASE_URL = "sqlite:///./blog.db"
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine de lectura: si no hay réplica configurada, se usa el mismo primario
+if DATABASE_READ_URL:
+    read_engine = create_engine(
+        DATABASE_READ_URL, pool_pre_ping=True, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW
+    )
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+else:
+    read_engine = engine
+    ReadSessionLocal = SessionLocal
+
 Base = declarative_base()
 
 
+# Espera media (EWMA) para obtener una conexión del pool, usada por el
+# control de admisión (ver rate_limit.py)
+_pool_wait = {"seconds": 0.0, "at": 0.0}
+POOL_WAIT_STALE_SECONDS = 5.0
+
+# Tiempo de las conexiones nuevas abiertas en el hilo actual durante un
+# checkout (handshake TLS, arranque en frío de Neon): no es espera en la cola
+_connect_time = threading.local()
+
+
+def _before_connect(dialect, connection_record, cargs, cparams):
+    _connect_time.started = time.monotonic()
+
+
+def _after_connect(dbapi_connection, connection_record):
+    started = getattr(_connect_time, "started", None)
+    if started is not None:
+        _connect_time.seconds = getattr(_connect_time, "seconds", 0.0) + time.monotonic() - started
+        _connect_time.started = None
+
+
+for _engine in {engine, read_engine}:
+    event.listen(_engine, "do_connect", _before_connect)
+    event.listen(_engine, "connect", _after_connect)
+
+
+def _checkout(db):
+    """
+    Obtiene la conexión de la sesión midiendo cuánto se esperó en la cola del
+    pool (sin contar el tiempo de abrir conexiones nuevas).
+    """
+    _connect_time.seconds = 0.0
+    start = time.monotonic()
+    db.connection()
+    now = time.monotonic()
+    wait = max(0.0, now - start - _connect_time.seconds)
+    _pool_wait["seconds"] = 0.8 * _pool_wait["seconds"] + 0.2 * wait
+    _pool_wait["at"] = now
+
+
+def get_pool_wait_seconds() -> float:
+    """Espera media reciente al pool; 0 si no hay muestras recientes."""
+    if time.monotonic() - _pool_wait["at"] > POOL_WAIT_STALE_SECONDS:
+        return 0.0
+    return _pool_wait["seconds"]
+
+
 def get_db():
     db = SessionLocal()
     try:
+        _checkout(db)
         yield db
     finally:
         db.close()
 
 
+# Datos iniciales de las columnas nuevas que se calculan a partir de otras
+# tablas. Se ejecutan en la misma transacción en que se agrega la columna.
+COLUMN_BACKFILLS = {
+    "users.post_count": (
+        "UPDATE users SET post_count = "
+        "(SELECT COUNT(*) FROM posts WHERE posts.author_id = users.id)"
+    ),
+}
+
+
+def upgrade_schema(bind=None) -> list:
+    """
+    Crea las tablas que falten y agrega a las existentes las columnas e índices
+    nuevos de los modelos (create_all no modifica tablas ya creadas), y llena
+    las columnas de COLUMN_BACKFILLS al agregarlas.
+    Retorna la lista de columnas agregadas como "tabla.columna".
+    """
+    # Registrar los modelos en Base.metadata (scripts como start.py no los importan)
+    import models  # noqa: F401
+
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    added = []
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    if isinstance(default, str):
+                        default = "'" + default.replace("'", "''") + "'"
+                    else:
+                        default = str(default.compile(dialect=bind.dialect))
+                    ddl += f" DEFAULT {default}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                connection.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+                backfill = COLUMN_BACKFILLS.get(f"{table.name}.{column.name}")
+                if backfill:
+                    connection.execute(text(backfill))
+            existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=connection, checkfirst=True)
+    return added
+
+
+# Estado de la réplica (por proceso: solo es una optimización)
+_replica_lock = threading.Lock()
+_replica_down_until = 0.0
+_replica_checked_at = 0.0
+
+# La ventana de lecturas al primario se guarda en el servidor, por usuario
+# (claim `sub` del JWT), en el estado compartido de la máquina; así funciona
+# con cualquier cliente que envíe su Bearer token. Además se envía al cliente
+# como cookie y cabecera con un timestamp, que valen en cualquier instancia.
+READ_STICKY_COOKIE = "read_primary_until"
+READ_STICKY_HEADER = "X-Read-Primary-Until"
+
+
+def mark_primary_sticky(response: Response, user_key: Optional[str] = None):
+    """
+    Hace que las lecturas del autor vayan al primario durante
+    READ_STICKY_SECONDS, para que vea lo que acaba de escribir aunque la
+    réplica aún no lo haya replicado. Se guarda en el servidor para
+    `user_key` (el `sub` del token) y se envía como cookie y como cabecera.
+
+    Es bloqueante (escribe en el estado compartido): llamar desde el threadpool.
+    """
+    if read_engine is engine:
+        return
+    until = time.time() + READ_STICKY_SECONDS
+    if user_key:
+        try:
+            conn = shared_store.connection()
+            conn.execute(
+                "INSERT INTO sticky_reads (key, until) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET until = excluded.until",
+                (user_key, until),
+            )
+            conn.execute("DELETE FROM sticky_reads WHERE until < ?", (until - READ_STICKY_SECONDS,))
+        except sqlite3.Error:
+            # Sin estado compartido queda la marca enviada al cliente
+            pass
+    response.set_cookie(
+        READ_STICKY_COOKIE, f"{until:.3f}",
+        max_age=math.ceil(READ_STICKY_SECONDS),
+        httponly=True, secure=True, samesite="none",
+    )
+    response.headers[READ_STICKY_HEADER] = f"{until:.3f}"
+
+
+def _token_subject(request: Request) -> Optional[str]:
+    authorization = request.headers.get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    # Import local: auth importa este módulo
+    from auth import ALGORITHM, SECRET_KEY
+    try:
+        payload = jwt.decode(authorization[7:].strip(), SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
+def _is_sticky(request: Request) -> bool:
+    now = time.time()
+    value = request.headers.get(READ_STICKY_HEADER) or request.cookies.get(READ_STICKY_COOKIE)
+    if value:
+        try:
+            until = float(value)
+        except ValueError:
+            until = 0.0
+        # El valor lo controla el cliente: no se aceptan ventanas más largas
+        # que READ_STICKY_SECONDS (más un margen por desfase de relojes)
+        if now < until <= now + READ_STICKY_SECONDS + 1:
+            return True
+    subject = _token_subject(request)
+    if not subject:
+        return False
+    try:
+        row = shared_store.connection().execute(
+            "SELECT until FROM sticky_reads WHERE key = ?", (subject,)
+        ).fetchone()
+    except sqlite3.Error:
+        return False
+    return row is not None and now < row[0]
+
+
+def mark_replica_unhealthy():
+    """
+    Descarta la réplica durante READ_REPLICA_RETRY_SECONDS; mientras tanto
+    las lecturas van al primario.
+    """
+    global _replica_down_until
+    with _replica_lock:
+        _replica_down_until = time.monotonic() + READ_REPLICA_RETRY_SECONDS
+
+
+def replica_available() -> bool:
+    """
+    Indica si la réplica puede usarse. Hace un `SELECT 1` como mucho cada
+    READ_REPLICA_CHECK_SECONDS; el resto de llamadas usan el último resultado.
+    """
+    global _replica_checked_at
+    if read_engine is engine:
+        return False
+    now = time.monotonic()
+    if now < _replica_down_until:
+        return False
+    if now - _replica_checked_at < READ_REPLICA_CHECK_SECONDS:
+        return True
+    with _replica_lock:
+        if now - _replica_checked_at < READ_REPLICA_CHECK_SECONDS:
+            return True
+        _replica_checked_at = now
+    try:
+        with read_engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+    except Exception:
+        mark_replica_unhealthy()
+        return False
+
+
+def get_read_db(request: Request):
+    """
+    Sesión para endpoints de solo lectura. Usa la réplica (DATABASE_READ_URL)
+    salvo que no esté configurada, esté caída o la petición traiga la marca
+    de mark_primary_sticky (el autor escribió hace poco); en esos casos usa
+    el primario. Si la conexión a la réplica falla, la petición se atiende
+    desde el primario.
+    """
+    use_replica = not _is_sticky(request) and replica_available()
+    db = ReadSessionLocal() if use_replica else SessionLocal()
+    try:
+        try:
+            _checkout(db)
+        except OperationalError:
+            if not use_replica:
+                raise
+            # La réplica no acepta conexiones: failover al primario
+            mark_replica_unhealthy()
+            db.close()
+            db = SessionLocal()
+            _checkout(db)
+        yield db
+    except OperationalError:
+        if use_replica:
+            mark_replica_unhealthy()
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+Exporta todos los posts a NDJSON o CSV (equivalente a GET /posts/export)
+
+Uso:
+    python export_posts.py --format ndjson --output posts.ndjson
+    python export_posts.py --format csv --since 2024-01-01T00:00:00 > posts.csv
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+
+from export_service import EXPORT_FORMATS, iter_posts_export
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exportar posts en streaming")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument(
+        "--since", type=datetime.fromisoformat, default=None,
+        help="Solo posts creados o actualizados desde esta fecha (ISO 8601)",
+    )
+    parser.add_argument("--output", default="-", help="Archivo de salida (- para stdout)")
+    args = parser.parse_args()
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    started_at = datetime.now().astimezone()
+    start = time.monotonic()
+    try:
+        for chunk in iter_posts_export(args.format, args.since):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(
+        f"✓ Exportación completada en {time.monotonic() - start:.1f}s. "
+        f"Para una exportación incremental usa: --since {started_at.isoformat()}",
+        file=sys.stderr,
+    )
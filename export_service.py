@@ -0,0 +1,97 @@
+"""
+Exportación de posts en streaming (NDJSON o CSV)
+
+Las filas se leen con un cursor del lado del servidor (stream_results +
+yield_per), así que la memoria usada no depende del tamaño de la tabla.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, union
+
+from database import SessionLocal
+from models import Post
+
+EXPORT_FIELDS = ["id", "title", "body", "seo_keywords", "author_id", "created_at", "updated_at"]
+# Filas que se traen del servidor por cada lote
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Tamaño aproximado de cada bloque enviado al cliente (caracteres)
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_post_rows(since: Optional[datetime] = None, session_factory=SessionLocal):
+    """
+    Itera todos los posts como diccionarios, ordenados por id (recorre la
+    clave primaria, sin ordenar en el servidor; el id crece con la fecha de
+    creación). Con `since` solo incluye los creados o actualizados desde esa
+    fecha: la unión de dos rangos sobre ix_posts_created_at e
+    ix_posts_updated_at, en vez de un OR que obliga a recorrer la tabla.
+    """
+    columns = [getattr(Post, field) for field in EXPORT_FIELDS]
+    statement = select(*columns).order_by(Post.id)
+    if since is not None:
+        changed_ids = union(
+            select(Post.id).where(Post.created_at >= since),
+            select(Post.id).where(Post.updated_at >= since),
+        )
+        statement = statement.where(Post.id.in_(changed_ids))
+    statement = statement.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+
+    db = session_factory()
+    try:
+        for row in db.execute(statement):
+            yield {field: _serialize(value) for field, value in row._mapping.items()}
+    finally:
+        db.close()
+
+
+def iter_posts_ndjson(since: Optional[datetime] = None, session_factory=SessionLocal):
+    """Genera bloques de texto NDJSON (un post por línea)."""
+    buffer = []
+    size = 0
+    for row in iter_post_rows(since, session_factory):
+        line = json.dumps(row, ensure_ascii=False) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def iter_posts_csv(since: Optional[datetime] = None, session_factory=SessionLocal):
+    """Genera bloques de texto CSV con cabecera."""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in iter_post_rows(since, session_factory):
+        writer.writerow(row)
+        if output.tell() >= EXPORT_CHUNK_SIZE:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+    if output.tell():
+        yield output.getvalue()
+
+
+def iter_posts_export(export_format: str, since: Optional[datetime] = None, session_factory=SessionLocal):
+    if export_format == "csv":
+        return iter_posts_csv(since, session_factory)
+    return iter_posts_ndjson(since, session_factory)
@@ -1,7 +1,12 @@
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import os
 from dotenv import load_dotenv
+from collections import deque
+from typing import Optional
+import asyncio
 import json
+import random
 import re
 import time
 
@@ -12,64 +17,237 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
 
+# Modelos en orden de preferencia: el primero es el principal y el siguiente
+# se usa como respaldo para las solicitudes "hedged"
+GEMINI_MODELS = [
+    'gemini-2.5-flash',      # Modelo flash más reciente (preferido)
+    'gemini-2.0-flash',      # Modelo flash alternativo
+    'gemini-pro-latest'      # Fallback
+]
 
-def generate_blog_post(prompt: str) -> dict:
+# Tiempo total máximo de una generación (se puede reducir por petición)
+GEMINI_DEADLINE_SECONDS = float(os.getenv("GEMINI_DEADLINE_SECONDS", "90"))
+# Tiempo máximo de cada intento individual
+GEMINI_ATTEMPT_TIMEOUT = float(os.getenv("GEMINI_ATTEMPT_TIMEOUT", "40"))
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+# Backoff exponencial con jitter completo entre reintentos
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))
+
+# Hedging: si el modelo principal no responde antes de su p95 observado,
+# se lanza la misma solicitud al modelo de respaldo y gana la primera
+GEMINI_HEDGING = os.getenv("GEMINI_HEDGING", "false").lower() in ("1", "true", "yes")
+GEMINI_HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "2"))
+GEMINI_HEDGE_DEFAULT_DELAY = float(os.getenv("GEMINI_HEDGE_DEFAULT_DELAY", "15"))
+# Muestras necesarias antes de confiar en el p95 observado
+GEMINI_HEDGE_MIN_SAMPLES = 20
+
+# Presupuesto de tokens del prompt del usuario. Un prompt que lo supere se
+# rechaza (reject) o se recorta (truncate) antes de llamar a Gemini
+GEMINI_MAX_PROMPT_TOKENS = int(os.getenv("GEMINI_MAX_PROMPT_TOKENS", "1000"))
+GEMINI_PROMPT_OVERFLOW = os.getenv("GEMINI_PROMPT_OVERFLOW", "reject").lower()
+# Caracteres por token para la estimación local (conservadora para español)
+CHARS_PER_TOKEN = 3.5
+
+# Instrucción de sistema: se configura una vez en cada modelo en lugar de
+# reenviarla concatenada al prompt. El formato JSON lo fuerza
+# response_mime_type, así que la instrucción solo describe los campos
+SYSTEM_INSTRUCTION = (
+    "Eres un experto escritor de blogs. Escribe un artículo completo sobre el "
+    "tema del usuario. Responde en JSON con: title (título atractivo), body "
+    "(artículo bien estructurado, en Markdown, con subtítulos si hace falta) y "
+    "seo_keywords (5 palabras clave separadas por comas)."
+)
+GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+# Errores transitorios que justifican un reintento
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    google_exceptions.ServerError,
+    google_exceptions.Aborted,
+)
+
+_models = {}
+_latencies = {}
+
+
+class GeminiTimeoutError(Exception):
+    """Gemini no respondió antes del deadline de la petición."""
+
+
+class PromptTooLongError(ValueError):
+    """El prompt supera GEMINI_MAX_PROMPT_TOKENS y GEMINI_PROMPT_OVERFLOW=reject."""
+
+    def __init__(self, tokens: int, limit: int):
+        super().__init__(f"El prompt tiene unos {tokens} tokens (máximo {limit})")
+        self.tokens = tokens
+        self.limit = limit
+
+
+def _get_model(model_name: str):
+    model = _models.get(model_name)
+    if model is None:
+        model = genai.GenerativeModel(
+            model_name,
+            system_instruction=SYSTEM_INSTRUCTION,
+            generation_config=GENERATION_CONFIG,
+        )
+        _models[model_name] = model
+    return model
+
+
+def reset_clients():
     """
-    Genera un artículo de blog completo usando Gemini API.
-    Retorna un diccionario con: title, body, seo_keywords
+    Descarta los clientes de Gemini creados hasta ahora. Se llama en cada
+    worker después del fork: un canal gRPC heredado del proceso maestro no
+    puede usarse en el hijo.
     """
-    if not GEMINI_API_KEY:
-        raise ValueError("GEMINI_API_KEY no está configurada")
+    _models.clear()
+    if GEMINI_API_KEY:
+        genai.configure(api_key=GEMINI_API_KEY)
 
-    # Usar modelo disponible - gemini-2.5-flash es el modelo flash más reciente disponible
-    # Intentar con modelos en orden de preferencia
-    models_to_try = [
-        'gemini-2.5-flash',      # Modelo flash más reciente (preferido)
-        'gemini-2.0-flash',      # Modelo flash alternativo
-        'gemini-pro-latest'      # Fallback
-    ]
-    
-    model = None
-    model_name = None
-    last_error = None
-    
-    for model_name in models_to_try:
-        try:
-            model = genai.GenerativeModel(model_name)
-            # Verificar que el modelo funciona intentando usarlo (sin generar contenido todavía)
-            # Solo verificamos que se puede instanciar, no generamos contenido
-            break
-        except Exception as e:
-            last_error = str(e)
-            continue
-    
-    if model is None:
-        raise ValueError(
-            f"No se pudo cargar ningún modelo de Gemini disponible. "
-            f"Modelos intentados: {', '.join(models_to_try)}. "
-            f"Último error: {last_error}"
+
+def estimate_tokens(text: str) -> int:
+    """Estimación local y rápida de los tokens de un texto."""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def fit_prompt(prompt: str) -> str:
+    """
+    Aplica el presupuesto de tokens al prompt del usuario con la estimación
+    local (sin viajes de red antes de la deduplicación y del presupuesto; el
+    consumo real lo registra cada generación). Retorna el prompt (recortado
+    en un límite de palabra con GEMINI_PROMPT_OVERFLOW=truncate) o lanza
+    PromptTooLongError.
+    """
+    prompt = prompt.strip()
+    tokens = estimate_tokens(prompt)
+    if tokens <= GEMINI_MAX_PROMPT_TOKENS:
+        return prompt
+    if GEMINI_PROMPT_OVERFLOW != "truncate":
+        raise PromptTooLongError(tokens, GEMINI_MAX_PROMPT_TOKENS)
+    cut = prompt[:int(GEMINI_MAX_PROMPT_TOKENS * CHARS_PER_TOKEN)]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut
+
+
+def _record_latency(model_name: str, seconds: float):
+    _latencies.setdefault(model_name, deque(maxlen=200)).append(seconds)
+
+
+def _hedge_delay(model_name: str) -> float:
+    """p95 de latencia observado del modelo, o un valor por defecto sin datos suficientes."""
+    samples = _latencies.get(model_name)
+    if not samples or len(samples) < GEMINI_HEDGE_MIN_SAMPLES:
+        return GEMINI_HEDGE_DEFAULT_DELAY
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return max(GEMINI_HEDGE_MIN_DELAY, p95)
+
+
+async def _call_model(model_name: str, prompt: str, timeout: float):
+    """Retorna (model_name, response, latencia en segundos)."""
+    start = time.monotonic()
+    try:
+        response = await asyncio.wait_for(
+            _get_model(model_name).generate_content_async(prompt), timeout
         )
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        # Intento cancelado (perdió el hedge) o agotado: la latencia real es al
+        # menos lo transcurrido. Registrarlo como cota inferior evita que el
+        # p95 observado solo vea las respuestas rápidas y se sesgue a la baja
+        _record_latency(model_name, time.monotonic() - start)
+        raise
+    latency = time.monotonic() - start
+    _record_latency(model_name, latency)
+    return model_name, response, latency
+
+
+async def _hedged_call(prompt: str, timeout: float):
+    """
+    Llama al modelo principal. Con GEMINI_HEDGING activo, si no ha respondido
+    tras su p95 lanza la misma solicitud al modelo de respaldo, devuelve la
+    primera respuesta exitosa y cancela la otra.
+    """
+    primary, fallback = GEMINI_MODELS[0], GEMINI_MODELS[1]
+    if not GEMINI_HEDGING:
+        return await _call_model(primary, prompt, timeout)
+
+    deadline = time.monotonic() + timeout
+    tasks = {asyncio.create_task(_call_model(primary, prompt, timeout))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=min(_hedge_delay(primary), timeout))
+        if done:
+            return done.pop().result()
+
+        remaining = deadline - time.monotonic()
+        tasks.add(asyncio.create_task(_call_model(fallback, prompt, remaining)))
+        pending = set(tasks)
+        last_error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=max(0.0, deadline - time.monotonic()),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                raise asyncio.TimeoutError()
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        # Cancelar la solicitud perdedora (o ambas si se agotó el tiempo)
+        for task in tasks:
+            if not task.done():
+                task.cancel()
 
-    system_prompt = """Eres un experto escritor de blogs. Genera un artículo de blog completo basado en el prompt proporcionado.
 
-El artículo debe incluir:
-1. Un título atractivo y descriptivo
-2. Un cuerpo de artículo bien estructurado con párrafos, subtítulos si es necesario, y contenido de calidad
-3. Palabras clave SEO relevantes separadas por comas
+async def _generate_with_retries(prompt: str, deadline: float):
+    """
+    Ejecuta la solicitud con un timeout por intento y reintentos con backoff
+    y jitter ante errores transitorios, sin sobrepasar el deadline.
+    """
+    last_error = None
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            return await _hedged_call(prompt, min(GEMINI_ATTEMPT_TIMEOUT, remaining))
+        except RETRYABLE_ERRORS as e:
+            last_error = e
+        if attempt < GEMINI_MAX_ATTEMPTS - 1:
+            backoff = random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
+            await asyncio.sleep(max(0.0, min(backoff, deadline - time.monotonic())))
 
-Responde SOLO con un JSON válido en el siguiente formato:
-{
-    "title": "Título del artículo",
-    "body": "Cuerpo completo del artículo con párrafos bien formateados...",
-    "seo_keywords": "palabra1, palabra2, palabra3, palabra4, palabra5"
-}
+    if last_error is None or isinstance(last_error, (asyncio.TimeoutError, google_exceptions.DeadlineExceeded)):
+        raise GeminiTimeoutError(
+            "Gemini no respondió dentro del tiempo límite de la petición"
+        )
+    raise last_error
 
-No incluyas ningún texto adicional fuera del JSON."""
 
-    full_prompt = f"{system_prompt}\n\nPrompt del usuario: {prompt}"
+async def generate_blog_post(prompt: str, deadline: Optional[float] = None) -> dict:
+    """
+    Genera un artículo de blog completo usando Gemini API.
+    El prompt se envía tal cual (la instrucción de sistema va en el modelo);
+    aplícale antes fit_prompt() para respetar el presupuesto de tokens.
+    `deadline` es el instante (time.monotonic()) en que la petición HTTP deja
+    de esperar; por defecto GEMINI_DEADLINE_SECONDS a partir de ahora.
+    Retorna un diccionario con: title, body, seo_keywords y el consumo
+    (model_name, prompt_tokens, output_tokens, total_tokens, latency_ms)
+    """
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY no está configurada")
+
+    if deadline is None:
+        deadline = time.monotonic() + GEMINI_DEADLINE_SECONDS
 
     try:
-        response = model.generate_content(full_prompt)
+        model_name, response, latency = await _generate_with_retries(prompt, deadline)
         
         # Extraer el JSON de la respuesta
         response_text = response.text.strip()
@@ -99,12 +277,27 @@ No incluyas ningún texto adicional fuera del JSON."""
         if "seo_keywords" not in blog_data:
             blog_data["seo_keywords"] = ""
         
+        # Metadatos de uso (tokens) que devuelve Gemini. total_token_count
+        # incluye los tokens de razonamiento ("thinking") de gemini-2.5, que se
+        # facturan pero no forman parte de candidates_token_count
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        total_tokens = getattr(usage, "total_token_count", 0) or prompt_tokens + output_tokens
+
         return {
             "title": blog_data["title"],
             "body": blog_data["body"],
-            "seo_keywords": blog_data.get("seo_keywords", "")
+            "seo_keywords": blog_data.get("seo_keywords", ""),
+            "model_name": model_name,
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": total_tokens,
+            "latency_ms": int(latency * 1000)
         }
     
+    except GeminiTimeoutError:
+        raise
     except Exception as e:
         error_str = str(e)
         # Manejar errores de cuota específicamente
@@ -117,5 +310,3 @@ No incluyas ningún texto adicional fuera del JSON."""
             )
         # Otros errores
         raise Exception(f"Error al generar el artículo con Gemini: {error_str}")
-
-
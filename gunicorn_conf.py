@@ -0,0 +1,146 @@
+"""
+Configuración de Gunicorn para producción (varios workers Uvicorn)
+
+Uso:
+    gunicorn main:app -c gunicorn_conf.py
+
+- El número de workers se calcula a partir de las CPUs y la memoria
+  disponibles (se puede fijar con WEB_CONCURRENCY).
+- Las conexiones a la base de datos se reparten entre los workers para que
+  el total no supere DB_MAX_CONNECTIONS.
+- La app se carga una sola vez en el proceso maestro (preload_app) y los
+  workers la comparten copy-on-write después del fork. Durante el preload no
+  se llama a la API de Gemini, y cada worker crea sus propios clientes.
+- Con más de un worker, el rate limiting usa RATE_LIMIT_BACKEND=sqlite para
+  que los workers compartan los buckets.
+- Los workers se reciclan tras MAX_REQUESTS peticiones (con jitter para que
+  no se reinicien todos a la vez).
+- Reinicio gradual: `kill -HUP <pid maestro>` reemplaza los workers uno a uno
+  esperando a que terminen sus peticiones (GRACEFUL_TIMEOUT). Para cargar
+  código nuevo con preload_app usa `kill -USR2` y luego `kill -WINCH` y
+  `kill -QUIT` sobre el maestro anterior.
+"""
+import multiprocessing
+import os
+
+from uvicorn.workers import UvicornWorker
+
+# Memoria aproximada por worker (MB) una vez compartida la app precargada
+WORKER_MEMORY_MB = int(os.getenv("WORKER_MEMORY_MB", "96"))
+# Memoria reservada para el proceso maestro y el sistema (MB)
+RESERVED_MEMORY_MB = int(os.getenv("RESERVED_MEMORY_MB", "128"))
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "8"))
+# Conexiones a la base de datos entre todos los workers (ej: límite del plan de Neon)
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "20"))
+
+# Event loop y parser HTTP: "auto" usa uvloop/httptools si están instalados
+SERVER_LOOP = os.getenv("SERVER_LOOP", "auto")
+SERVER_HTTP = os.getenv("SERVER_HTTP", "auto")
+
+
+def _available_cpus() -> int:
+    """CPUs utilizables por el proceso, respetando afinidad y cuota de cgroup."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = multiprocessing.cpu_count()
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def _available_memory_mb():
+    """Memoria disponible en MB (límite de cgroup si existe), o None si no se conoce."""
+    limits = []
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            value = f.read().strip()
+        if value != "max":
+            limits.append(int(value) // (1024 * 1024))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    limits.append(int(line.split()[1]) // 1024)
+                    break
+    except (OSError, ValueError):
+        pass
+    return min(limits) if limits else None
+
+
+def compute_workers() -> int:
+    """
+    Calcula el número de workers: uno por CPU utilizable (un worker async ya
+    atiende muchas peticiones a la vez; la fórmula 2 x CPUs + 1 es para
+    workers síncronos), limitado por la memoria disponible y por MAX_WORKERS.
+    Con una cuota de CPU fraccionaria se usa un solo worker. WEB_CONCURRENCY
+    tiene prioridad.
+    """
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.getenv("WEB_CONCURRENCY")))
+    workers = _available_cpus()
+    memory_mb = _available_memory_mb()
+    if memory_mb is not None:
+        workers = min(workers, (memory_mb - RESERVED_MEMORY_MB) // WORKER_MEMORY_MB)
+    return max(1, min(workers, MAX_WORKERS))
+
+
+class BlogUvicornWorker(UvicornWorker):
+    """Worker Uvicorn con event loop y parser HTTP configurables."""
+    CONFIG_KWARGS = {"loop": SERVER_LOOP, "http": SERVER_HTTP}
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = compute_workers()
+# Con varios workers los buckets de rate limiting deben compartirse; si no,
+# cada worker aplicaría el límite completo (se fija antes del preload de la app)
+if workers > 1:
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "sqlite")
+# Pool de cada worker: su parte de DB_MAX_CONNECTIONS, sin overflow
+os.environ.setdefault("DB_POOL_SIZE", str(max(1, DB_MAX_CONNECTIONS // workers)))
+os.environ.setdefault("DB_MAX_OVERFLOW", "0")
+# list_models crearía un cliente gRPC en el maestro que los workers heredarían
+os.environ.setdefault("GEMINI_VALIDATE_ON_STARTUP", "false")
+worker_class = "gunicorn_conf.BlogUvicornWorker"
+preload_app = True
+max_requests = int(os.getenv("MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "100"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+# Solo se confía en las cabeceras X-Forwarded-* de estas IPs. Con "*" uvicorn
+# tomaría como IP del cliente la primera entrada de X-Forwarded-For, que el
+# cliente puede inventar; el rate limiting lee la entrada añadida por el proxy
+# de Render con RATE_LIMIT_PROXY_HOPS
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    # main.py abre conexiones al validar la base de datos durante el preload;
+    # cada worker debe crear su propio pool en vez de heredar esos sockets
+    from database import engine, read_engine
+    engine.dispose(close=False)
+    if read_engine is not engine:
+        read_engine.dispose(close=False)
+    # Los clientes gRPC de Gemini no sobreviven al fork: cada worker crea los suyos
+    from gemini_service import reset_clients
+    reset_clients()
+
+
+def when_ready(server):
+    server.log.info(
+        f"Workers: {workers} (CPUs: {_available_cpus()}, "
+        f"memoria disponible: {_available_memory_mb()} MB, "
+        f"conexiones a la base de datos por worker: {os.environ['DB_POOL_SIZE']}), "
+        f"loop={SERVER_LOOP}, http={SERVER_HTTP}"
+    )
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Importa posts desde un archivo NDJSON (equivalente a POST /posts/import)
+
+Uso:
+    python import_posts.py posts.ndjson --author-id 1
+    cat posts.ndjson | python import_posts.py - --author-id 1
+
+Cada línea se valida con PostCreate (title, body, seo_keywords y, opcionales,
+author_id y created_at). Las líneas sin author_id se asignan a --author-id.
+"""
+import argparse
+import sys
+
+from import_service import IMPORT_BATCH_SIZE, NDJSONLineSplitter, PostImporter
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importar posts desde NDJSON")
+    parser.add_argument("input", help="Archivo NDJSON (- para stdin)")
+    parser.add_argument("--author-id", type=int, required=True,
+                        help="Autor para las líneas sin author_id")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    importer = PostImporter(default_author_id=args.author_id, batch_size=args.batch_size)
+    splitter = NDJSONLineSplitter()
+
+    def lines():
+        for chunk in iter(lambda: source.read(64 * 1024), b""):
+            yield from splitter.feed(chunk)
+        yield from splitter.close()
+
+    try:
+        for line in lines():
+            if importer.add_line(line):
+                importer.flush()
+                print(f"  {importer.imported} posts importados...", file=sys.stderr)
+        importer.flush()
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+
+    report = importer.report()
+    print(
+        f"✓ {report['rows_imported']} posts importados, {report['rows_failed']} con errores "
+        f"en {report['seconds']:.1f}s ({report['rows_per_second']} filas/s)"
+    )
+    for error in report["errors"]:
+        print(f"  ✗ Línea {error['line']}: {error['error']}")
+    sys.exit(1 if report["rows_failed"] else 0)
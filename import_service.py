@@ -0,0 +1,190 @@
+"""
+Importación masiva de posts desde NDJSON
+
+Cada línea se valida con PostCreate y las filas válidas se insertan por lotes
+(un INSERT executemany y un commit por lote), así que la memoria usada solo
+depende del tamaño del lote y no del archivo.
+
+El HTML no se renderiza durante la importación (es lo más costoso por fila):
+los posts quedan con render_version NULL, GET /posts/{id}?format=html los
+renderiza al vuelo y rerender_posts.py los completa después.
+"""
+import json
+import os
+import time
+from collections import Counter
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select, update
+
+from database import SessionLocal
+from models import Post, User
+from schemas import PostCreate
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Tamaño máximo de una línea NDJSON (bytes); las más largas se descartan con error
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", str(2 * 1024 * 1024)))
+# Máximo de errores detallados en el reporte (el resto solo se cuenta)
+IMPORT_MAX_ERRORS = 100
+
+
+class NDJSONLineSplitter:
+    """
+    Separa en líneas un flujo de bloques de bytes sin volver a copiar lo ya
+    recibido. Una línea de más de `max_bytes` se descarta a medida que llega
+    y se entrega como None.
+    """
+
+    def __init__(self, max_bytes: int = IMPORT_MAX_LINE_BYTES):
+        self.max_bytes = max_bytes
+        self._parts = []
+        self._size = 0
+        self._oversized = False
+
+    def _take_line(self):
+        line = None if self._oversized else b"".join(self._parts)
+        self._parts = []
+        self._size = 0
+        self._oversized = False
+        return line
+
+    def _append(self, piece: bytes):
+        if self._oversized or not piece:
+            return
+        self._size += len(piece)
+        if self._size > self.max_bytes:
+            self._oversized = True
+            self._parts = []
+        else:
+            self._parts.append(piece)
+
+    def feed(self, chunk: bytes):
+        """Genera las líneas completas del bloque (bytes, o None si es demasiado larga)."""
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end == -1:
+                self._append(chunk[start:])
+                return
+            self._append(chunk[start:end])
+            yield self._take_line()
+            start = end + 1
+
+    def close(self):
+        """Genera la última línea si el flujo no terminaba en salto de línea."""
+        if self._size or self._oversized:
+            yield self._take_line()
+
+
+class PostImporter:
+    """
+    Acumula filas validadas y las inserta en lotes de `batch_size`.
+    Las filas sin author_id se asignan a `default_author_id`.
+    """
+
+    def __init__(self, default_author_id: int, batch_size: int = IMPORT_BATCH_SIZE,
+                 session_factory=SessionLocal):
+        self.default_author_id = default_author_id
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self.pending = []
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self._line_no = 0
+        self._started = time.monotonic()
+
+    def _error(self, line_no: int, message: str):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def add_line(self, line) -> bool:
+        """
+        Valida una línea NDJSON y la deja pendiente de insertar. `None`
+        representa una línea descartada por superar IMPORT_MAX_LINE_BYTES.
+        Retorna True cuando hay un lote completo listo para flush().
+        """
+        self._line_no += 1
+        if line is None:
+            self._error(self._line_no, f"Línea demasiado larga (máximo {IMPORT_MAX_LINE_BYTES} bytes)")
+            return False
+        try:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            line = line.strip()
+            if not line:
+                return False
+            post = PostCreate.model_validate(json.loads(line))
+        except UnicodeDecodeError as e:
+            self._error(self._line_no, f"UTF-8 inválido en la posición {e.start}")
+            return False
+        except json.JSONDecodeError as e:
+            self._error(self._line_no, f"JSON inválido: {e.msg}")
+            return False
+        except ValidationError as e:
+            self._error(self._line_no, "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            ))
+            return False
+        self.pending.append((self._line_no, post))
+        return len(self.pending) >= self.batch_size
+
+    def flush(self):
+        """Inserta las filas pendientes en una sola transacción."""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        rows = []
+        row_lines = []
+        db = self.session_factory()
+        try:
+            author_ids = {post.author_id or self.default_author_id for _, post in batch}
+            existing = set(db.scalars(select(User.id).where(User.id.in_(author_ids))))
+            for line_no, post in batch:
+                author_id = post.author_id or self.default_author_id
+                if author_id not in existing:
+                    self._error(line_no, f"author_id {author_id} no existe")
+                    continue
+                row = {
+                    "title": post.title,
+                    "body": post.body,
+                    "seo_keywords": post.seo_keywords,
+                    "author_id": author_id,
+                }
+                if post.created_at is not None:
+                    row["created_at"] = post.created_at
+                rows.append(row)
+                row_lines.append(line_no)
+            if rows:
+                # Separar filas con y sin created_at: executemany necesita las mismas columnas
+                for group in (
+                    [r for r in rows if "created_at" in r],
+                    [r for r in rows if "created_at" not in r],
+                ):
+                    if group:
+                        db.execute(insert(Post), group)
+                for author_id, count in Counter(r["author_id"] for r in rows).items():
+                    db.execute(
+                        update(User)
+                        .where(User.id == author_id)
+                        .values(post_count=User.post_count + count)
+                    )
+            db.commit()
+            self.imported += len(rows)
+        except Exception as e:
+            db.rollback()
+            for line_no in row_lines:
+                self._error(line_no, f"Error al insertar el lote: {str(e)[:200]}")
+        finally:
+            db.close()
+
+    def report(self) -> dict:
+        elapsed = time.monotonic() - self._started
+        return {
+            "rows_imported": self.imported,
+            "rows_failed": self.failed,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(self.imported / elapsed, 1) if elapsed > 0 else None,
+            "errors": self.errors,
+        }
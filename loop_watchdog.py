@@ -0,0 +1,198 @@
+"""
+Detector de bloqueos del event loop (para desarrollo y staging)
+
+Una corrutina actualiza un latido cada pocos milisegundos; al despertar, el
+hueco desde el latido anterior (cota superior de la duración del bloqueo,
+con un error de como mucho un intervalo) se compara con
+LOOP_WATCHDOG_THRESHOLD_MS. Mientras el latido está retrasado, un hilo aparte
+captura la pila del hilo del event loop (el código que lo está bloqueando) y
+la ruta de la petición en curso. Los bloqueos se registran en el log y en las
+estadísticas que muestra GET /health.
+
+Con LOOP_WATCHDOG_STRICT=true (modo test) una petición que haya bloqueado el
+loop termina con LoopBlockedError, así que el TestClient hace fallar el test.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG_ENABLED", "false").lower() in ("1", "true", "yes")
+LOOP_WATCHDOG_THRESHOLD_MS = float(os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", "100"))
+LOOP_WATCHDOG_STRICT = os.getenv("LOOP_WATCHDOG_STRICT", "false").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger("loop_watchdog")
+
+_SCOPE_KEY = "loop_watchdog.request_id"
+
+
+class LoopBlockedError(RuntimeError):
+    """Una petición bloqueó el event loop más que el umbral (modo estricto)."""
+
+
+def _describe_frames(frame):
+    """
+    Busca, desde el frame más interno, el `scope` ASGI de la petición en curso.
+    Retorna (ruta, id de petición) o (None, None) si el bloqueo no ocurre
+    dentro de una petición.
+    """
+    while frame is not None:
+        scope = frame.f_locals.get("scope")
+        if isinstance(scope, dict) and scope.get("type") == "http":
+            route = scope.get("route")
+            path = getattr(route, "path", None) or scope.get("path")
+            return f"{scope.get('method', '')} {path}", scope.get(_SCOPE_KEY)
+        frame = frame.f_back
+    return None, None
+
+
+class LoopWatchdog:
+    def __init__(self, threshold_ms: float = LOOP_WATCHDOG_THRESHOLD_MS, strict: bool = LOOP_WATCHDOG_STRICT):
+        self.threshold = threshold_ms / 1000
+        # En modo estricto se guardan los bloqueos de cada petición para fallarla
+        self.strict = strict
+        # El hueco entre dos latidos contiene el bloqueo entero, así que nunca
+        # lo subestima y lo sobrestima como mucho en un intervalo: latido fino
+        # (threshold / 20, <= 5 ms)
+        self.interval = max(0.001, min(self.threshold / 20, 0.005))
+        # El vigilante revisa cada threshold / 4 y captura la pila cuando el
+        # latido lleva medio umbral de retraso, así un bloqueo de al menos el
+        # umbral siempre se muestrea mientras dura
+        self.watch_interval = max(self.interval, self.threshold / 4)
+        self.events = deque(maxlen=100)
+        self.by_route = {}
+        self._pending = {}
+        self._beat = time.monotonic()
+        self._seq = 0
+        self._sample = None
+        self._loop = None
+        self._loop_thread_id = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Arranca el latido y el hilo vigilante (llamar desde el event loop).
+        Si cambia el loop (el TestClient crea uno por petición fuera de un
+        bloque `with`) el latido se vuelve a lanzar en el loop nuevo.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._seq += 1
+        self._sample = None
+        loop.create_task(self._heartbeat(loop))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    async def _heartbeat(self, loop):
+        while loop is self._loop:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            blocked = now - self._beat
+            stalled_seq = self._seq
+            self._beat = now
+            self._seq += 1
+            if blocked >= self.threshold:
+                sample = self._sample
+                # Solo vale la pila capturada durante este mismo retraso
+                if sample is None or sample["seq"] != stalled_seq:
+                    sample = None
+                self._record(blocked, sample)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            loop = self._loop
+            if loop is None or loop.is_closed():
+                continue
+            seq = self._seq
+            if time.monotonic() - self._beat < self.threshold / 2:
+                continue
+            if self._sample is not None and self._sample["seq"] == seq:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            route, request_id = _describe_frames(frame)
+            stack = "".join(traceback.format_stack(frame)[-15:])
+            # Si el latido avanzó mientras se capturaba, el bloqueo ya terminó
+            # y la pila puede ser de otro código: descartarla
+            if self._seq == seq:
+                self._sample = {"seq": seq, "route": route, "request_id": request_id, "stack": stack}
+
+    def _record(self, blocked: float, sample):
+        event = {
+            "blocked_ms": round(blocked * 1000, 1),
+            "route": (sample and sample["route"]) or "(fuera de una petición)",
+            "request_id": sample["request_id"] if sample else None,
+            "stack": sample["stack"] if sample else "(pila no capturada)\n",
+        }
+        logger.warning(
+            "Event loop bloqueado %.0f ms en %s\n%s",
+            event["blocked_ms"], event["route"], event["stack"],
+        )
+        with self._lock:
+            self.events.append(event)
+            stats = self.by_route.setdefault(event["route"], {"count": 0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["max_ms"] = max(stats["max_ms"], event["blocked_ms"])
+            if self.strict and event["request_id"] is not None:
+                self._pending.setdefault(event["request_id"], []).append(event)
+
+    def pop_request_events(self, request_id: int) -> list:
+        with self._lock:
+            return self._pending.pop(request_id, [])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold_ms": self.threshold * 1000,
+                "blocks": sum(s["count"] for s in self.by_route.values()),
+                "by_route": {route: dict(s) for route, s in self.by_route.items()},
+                "recent": [
+                    {"route": e["route"], "blocked_ms": e["blocked_ms"]}
+                    for e in list(self.events)[-10:]
+                ],
+            }
+
+
+loop_watchdog = LoopWatchdog()
+_request_ids = itertools.count(1)
+
+
+class LoopWatchdogMiddleware:
+    """Marca cada petición para poder atribuirle los bloqueos del loop."""
+
+    def __init__(self, app, watchdog: LoopWatchdog = loop_watchdog):
+        self.app = app
+        self.watchdog = watchdog
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.watchdog.start()
+        request_id = next(_request_ids)
+        scope[_SCOPE_KEY] = request_id
+        await self.app(scope, receive, send)
+        if not self.watchdog.strict:
+            return
+        # Dar al latido la oportunidad de cerrar un bloqueo recién terminado
+        await asyncio.sleep(self.watchdog.interval * 2)
+        events = self.watchdog.pop_request_events(request_id)
+        if events:
+            worst = max(events, key=lambda e: e["blocked_ms"])
+            raise LoopBlockedError(
+                f"{worst['route']} bloqueó el event loop {worst['blocked_ms']} ms "
+                f"(umbral {self.watchdog.threshold * 1000:.0f} ms)\n{worst['stack']}"
+            )
@@ -1,12 +1,29 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from datetime import timedelta
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session, undefer_group
+from datetime import datetime, timedelta
+import base64
+import json
+import time
+from typing import Optional, Union
 import os
 from dotenv import load_dotenv
 
-from database import get_db, engine, Base
+from database import (
+    get_db,
+    get_read_db,
+    mark_primary_sticky,
+    READ_STICKY_HEADER,
+    replica_available,
+    upgrade_schema,
+    engine,
+    SessionLocal,
+    ReadSessionLocal
+)
 from models import User, Post
 from schemas import (
     UserCreate,
@@ -14,17 +31,38 @@ from schemas import (
     Token,
     PostGenerate,
     PostResponse,
-    PostCreate
+    PostHtmlResponse,
+    PostPage,
+    PostCreate,
+    UsageResponse,
+    ImportReport
 )
 from auth import (
     get_password_hash,
     authenticate_user,
     create_access_token,
     get_current_user,
+    get_current_admin,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from gemini_service import generate_blog_post
-from validators import validate_database_connection, validate_gemini_api, get_health_status
+from gemini_service import (
+    generate_blog_post, fit_prompt, estimate_tokens,
+    GeminiTimeoutError, PromptTooLongError, GEMINI_DEADLINE_SECONDS
+)
+from render_service import render_body, RENDER_VERSION
+from rate_limit import RateLimitMiddleware
+from loop_watchdog import LoopWatchdogMiddleware, loop_watchdog, LOOP_WATCHDOG_ENABLED
+from usage_service import (
+    get_usage, usage_summary, reserve_usage, release_usage, record_usage, BUDGET_OUTPUT_RESERVE_TOKENS
+)
+from prompt_index import (
+    backfill_prompt_bands, find_similar, index_prompt, prompt_signature, PROMPT_DEDUP_MODE
+)
+from export_service import EXPORT_FORMATS, iter_posts_export
+from import_service import NDJSONLineSplitter, PostImporter
+from validators import (
+    validate_database_connection, validate_gemini_api, get_health_status, GEMINI_VALIDATE_ON_STARTUP
+)
 
 load_dotenv()
 
@@ -39,8 +77,13 @@ if db_valid:
     print(f"✓ Base de datos: {db_message}")
     # Crear las tablas solo si la conexión es exitosa
     try:
-        Base.metadata.create_all(bind=engine)
+        upgrade_schema(engine)
         print("✓ Tablas de base de datos creadas/verificadas")
+        # Bandas MinHash de los prompts guardados antes de existir prompt_bands
+        with SessionLocal() as db:
+            indexed = backfill_prompt_bands(db)
+        if indexed:
+            print(f"✓ Índice de prompts: {indexed} prompts indexados")
     except Exception as e:
         print(f"⚠ Error al crear tablas: {str(e)}")
 else:
@@ -48,7 +91,7 @@ else:
     print("⚠ La aplicación puede no funcionar correctamente sin conexión a la base de datos")
 
 # Validar Gemini API
-gemini_valid, gemini_message = validate_gemini_api()
+gemini_valid, gemini_message = validate_gemini_api(remote=GEMINI_VALIDATE_ON_STARTUP)
 if gemini_valid:
     print(f"✓ Gemini API: {gemini_message}")
 else:
@@ -63,6 +106,14 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Detector de bloqueos del event loop (opt-in, para desarrollo y staging)
+if LOOP_WATCHDOG_ENABLED:
+    app.add_middleware(LoopWatchdogMiddleware)
+
+# Rate limiting y load shedding (se registra antes que CORS para que las
+# respuestas 429/503 también lleven las cabeceras CORS)
+app.add_middleware(RateLimitMiddleware)
+
 # Configurar CORS
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
@@ -86,6 +137,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Permite al frontend leer y reenviar la marca de lecturas al primario
+    expose_headers=[READ_STICKY_HEADER],
 )
 
 
@@ -99,6 +152,11 @@ async def root():
             "login": "POST /token",
             "generate_post": "POST /generate-post (protegido)",
             "get_posts": "GET /posts (público)",
+            "export_posts": "GET /posts/export?format=ndjson|csv (público)",
+            "import_posts": "POST /posts/import (administradores)",
+            "user_posts": "GET /users/{user_id}/posts (público)",
+            "my_posts": "GET /me/posts (protegido)",
+            "my_usage": "GET /me/usage (protegido)",
             "health": "GET /health (estado de servicios)"
         }
     }
@@ -111,6 +169,8 @@ async def health_check():
     (Base de datos y Gemini API)
     """
     health_status = get_health_status(engine)
+    if LOOP_WATCHDOG_ENABLED:
+        health_status["event_loop"] = loop_watchdog.stats()
     if health_status["status"] == "healthy":
         return health_status
     else:
@@ -187,33 +247,118 @@ async def login(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+def get_request_deadline(request: Request) -> float:
+    """
+    Deadline de la petición (time.monotonic()). El cliente puede acortarlo con
+    la cabecera `X-Request-Timeout` (segundos); nunca supera GEMINI_DEADLINE_SECONDS.
+    """
+    budget = GEMINI_DEADLINE_SECONDS
+    header = request.headers.get("X-Request-Timeout")
+    if header:
+        try:
+            budget = min(budget, max(1.0, float(header)))
+        except ValueError:
+            pass
+    return time.monotonic() + budget
+
+
 @app.post("/generate-post", response_model=PostResponse, status_code=status.HTTP_201_CREATED)
 async def generate_post(
     post_data: PostGenerate,
+    response: Response,
     current_user: User = Depends(get_current_user),
+    deadline: float = Depends(get_request_deadline),
     db: Session = Depends(get_db)
 ):
     """
-    Genera un artículo de blog usando IA (protegido por JWT)
+    Genera un artículo de blog usando IA (protegido por JWT).
+    Si ya existe un artículo con un prompt muy parecido, según PROMPT_DEDUP_MODE
+    lo ofrece (409) o lo devuelve sin llamar a Gemini.
     """
+    # Presupuesto de tokens del prompt (rechaza o recorta según GEMINI_PROMPT_OVERFLOW)
+    try:
+        prompt = fit_prompt(post_data.prompt)
+    except PromptTooLongError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{e}. Acorta el prompt"
+        )
+
+    signature = await run_in_threadpool(prompt_signature, prompt)
+    # Los prompts sin términos (solo palabras gramaticales) no tienen firma: no se comparan
+    if PROMPT_DEDUP_MODE in ("offer", "reuse") and not post_data.force and signature is not None:
+        match = await run_in_threadpool(find_similar, db, signature)
+        similar_post = db.get(Post, match[0]) if match else None
+        if similar_post:
+            if PROMPT_DEDUP_MODE == "reuse":
+                response.status_code = status.HTTP_200_OK
+                response.headers["X-Similar-Post-Id"] = str(similar_post.id)
+                response.headers["X-Prompt-Similarity"] = f"{match[1]:.3f}"
+                return similar_post
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={
+                    "message": "Ya existe un artículo con un prompt muy parecido. "
+                               "Envía force=true para generar uno nuevo",
+                    "similar_post_id": similar_post.id,
+                    "similarity": round(match[1], 3)
+                }
+            )
+
+    # Reservar del presupuesto los tokens estimados antes de llamar a Gemini
+    reserved = estimate_tokens(prompt) + BUDGET_OUTPUT_RESERVE_TOKENS
+    budget_error = reserve_usage(db, current_user.id, reserved)
+    if budget_error:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=budget_error
+        )
+
     try:
         # Generar el artículo usando Gemini
-        generated_content = generate_blog_post(post_data.prompt)
+        try:
+            generated_content = await generate_blog_post(prompt, deadline=deadline)
+        except BaseException:
+            # Sin generación no hay consumo: se devuelve la reserva
+            release_usage(db, current_user.id, reserved)
+            db.commit()
+            raise
         
         # Crear el post en la base de datos
         db_post = Post(
             title=generated_content["title"],
             body=generated_content["body"],
             seo_keywords=generated_content["seo_keywords"],
-            author_id=current_user.id
+            prompt=prompt,
+            model_name=generated_content["model_name"],
+            prompt_tokens=generated_content["prompt_tokens"],
+            output_tokens=generated_content["output_tokens"],
+            total_tokens=generated_content["total_tokens"],
+            generation_ms=generated_content["latency_ms"],
+            author_id=current_user.id,
+            **render_body(generated_content["body"])
         )
         
         db.add(db_post)
+        if signature is not None:
+            db.flush()
+            index_prompt(db, db_post.id, signature)
+        db.query(User).filter(User.id == current_user.id).update(
+            {User.post_count: User.post_count + 1}, synchronize_session=False
+        )
+        record_usage(db, current_user.id, generated_content["total_tokens"], reserved)
         db.commit()
         db.refresh(db_post)
+        # Las lecturas del autor van al primario mientras la réplica se pone al día
+        await run_in_threadpool(mark_primary_sticky, response, current_user.email)
         
         return db_post
     
+    except GeminiTimeoutError as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except ValueError as e:
         error_str = str(e)
         # Manejar errores de cuota como 429 (Too Many Requests)
@@ -246,7 +391,7 @@ async def generate_post(
 async def get_posts(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Obtiene todos los artículos generados (endpoint público)
@@ -255,18 +400,95 @@ async def get_posts(
     return posts
 
 
-@app.get("/posts/{post_id}", response_model=PostResponse)
-async def get_post(post_id: int, db: Session = Depends(get_db)):
+@app.get("/posts/export")
+async def export_posts(
+    format: str = "ndjson",
+    since: Optional[datetime] = None,
+    admin: User = Depends(get_current_admin)
+):
     """
-    Obtiene un artículo específico por ID (endpoint público)
+    Exporta todos los artículos en streaming como NDJSON o CSV (solo
+    administradores: cada exportación ocupa una conexión del pool mientras
+    el cliente lee). Con `since` solo incluye los creados o actualizados
+    desde esa fecha.
     """
-    post = db.query(Post).filter(Post.id == post_id).first()
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Formato no soportado. Usa uno de: {', '.join(EXPORT_FORMATS)}"
+        )
+    # replica_available() puede hacer un SELECT 1 bloqueante: fuera del event loop
+    use_replica = await run_in_threadpool(replica_available)
+    session_factory = ReadSessionLocal if use_replica else SessionLocal
+    return StreamingResponse(
+        iter_posts_export(format, since, session_factory),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="posts.{format}"'}
+    )
+
+
+@app.post("/posts/import", response_model=ImportReport)
+async def import_posts(request: Request, admin: User = Depends(get_current_admin)):
+    """
+    Importa artículos desde un cuerpo NDJSON en streaming (solo administradores).
+    Cada línea se valida con PostCreate; sin author_id se asigna al administrador.
+    Se insertan por lotes, cada uno en su propia transacción.
+    """
+    importer = PostImporter(default_author_id=admin.id)
+    splitter = NDJSONLineSplitter()
+    async for chunk in request.stream():
+        for line in splitter.feed(chunk):
+            if importer.add_line(line):
+                # Insertar el lote fuera del event loop
+                await run_in_threadpool(importer.flush)
+    for line in splitter.close():
+        importer.add_line(line)
+    await run_in_threadpool(importer.flush)
+    return importer.report()
+
+
+# Formatos de GET /posts/{post_id}
+POST_FORMATS = ("markdown", "html")
+
+
+@app.get("/posts/{post_id}", response_model=Union[PostHtmlResponse, PostResponse])
+async def get_post(post_id: int, format: str = "markdown", db: Session = Depends(get_read_db)):
+    """
+    Obtiene un artículo específico por ID (endpoint público).
+    Con `format=html` incluye el cuerpo ya renderizado (`body_html`) y la tabla
+    de contenidos (`toc`).
+    """
+    if format not in POST_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Formato no soportado. Usa uno de: {', '.join(POST_FORMATS)}"
+        )
+    query = db.query(Post).filter(Post.id == post_id)
+    if format == "html":
+        query = query.options(undefer_group("rendered"))
+    post = query.first()
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Artículo no encontrado"
         )
-    return post
+    if format != "html":
+        return PostResponse.model_validate(post)
+
+    rendered = {
+        "body_html": post.body_html,
+        "body_toc": post.body_toc,
+        "reading_time_minutes": post.reading_time_minutes
+    }
+    if post.render_version != RENDER_VERSION:
+        # Aún no re-renderizado (ver rerender_posts.py): renderizar sin guardar
+        rendered = render_body(post.body)
+    return PostHtmlResponse(
+        **PostResponse.model_validate(post).model_dump(exclude={"reading_time_minutes"}),
+        reading_time_minutes=rendered["reading_time_minutes"],
+        body_html=rendered["body_html"],
+        toc=json.loads(rendered["body_toc"])
+    )
 
 
 @app.get("/me", response_model=UserResponse)
@@ -277,3 +499,87 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 
+
+
+def _encode_cursor(post: Post) -> str:
+    return base64.urlsafe_b64encode(str(post.id).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación inválido"
+        )
+
+
+def _author_posts_page(db: Session, author_id: int, cursor, limit: int) -> dict:
+    """
+    Página de posts de un autor ordenados del más reciente al más antiguo.
+    Usa paginación por keyset sobre el índice (author_id, created_at, id).
+    """
+    limit = max(1, min(limit, 100))
+    query = db.query(Post).filter(Post.author_id == author_id)
+    if cursor:
+        # El created_at del cursor se lee de la propia fila para comparar
+        # con el valor tal cual está almacenado
+        post_id = _decode_cursor(cursor)
+        created_at = (
+            select(Post.created_at).where(Post.id == post_id).scalar_subquery()
+        )
+        query = query.filter(
+            or_(
+                Post.created_at < created_at,
+                and_(Post.created_at == created_at, Post.id < post_id)
+            )
+        )
+    posts = query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit + 1).all()
+    next_cursor = _encode_cursor(posts[limit - 1]) if len(posts) > limit else None
+    return {"items": posts[:limit], "next_cursor": next_cursor}
+
+
+@app.get("/me/usage", response_model=UsageResponse)
+async def read_my_usage(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Consumo de tokens de Gemini del usuario actual (día y mes en UTC) y sus
+    presupuestos (protegido)
+    """
+    return usage_summary(get_usage(db, current_user.id))
+
+
+@app.get("/me/posts", response_model=PostPage)
+async def read_my_posts(
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Obtiene los artículos del usuario actual (protegido).
+    Para la siguiente página, envía `next_cursor` como `cursor`.
+    """
+    return _author_posts_page(db, current_user.id, cursor, limit)
+
+
+@app.get("/users/{user_id}/posts", response_model=PostPage)
+async def get_user_posts(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Obtiene los artículos de un usuario (endpoint público).
+    Para la siguiente página, envía `next_cursor` como `cursor`.
+    """
+    if db.get(User, user_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Usuario no encontrado"
+        )
+    return _author_posts_page(db, user_id, cursor, limit)
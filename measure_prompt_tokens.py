@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Mide con count_tokens de Gemini los tokens de entrada de cada generación con
+la forma de solicitud anterior (instrucción larga concatenada al prompt) y la
+actual (SYSTEM_INSTRUCTION configurada en el modelo + prompt del usuario)
+
+Uso:
+    python measure_prompt_tokens.py ["prompt 1" "prompt 2" ...]
+
+Necesita GEMINI_API_KEY y acceso a la API (count_tokens no consume cuota de
+generación). Sin prompts usa unos de ejemplo.
+"""
+import argparse
+
+import google.generativeai as genai
+
+from gemini_service import GEMINI_API_KEY, GEMINI_MODELS, _get_model
+
+# Instrucción que se concatenaba a cada prompt antes de SYSTEM_INSTRUCTION
+LEGACY_SYSTEM_PROMPT = """Eres un experto escritor de blogs. Genera un artículo de blog completo basado en el prompt proporcionado.
+
+El artículo debe incluir:
+1. Un título atractivo y descriptivo
+2. Un cuerpo de artículo bien estructurado con párrafos, subtítulos si es necesario, y contenido de calidad
+3. Palabras clave SEO relevantes separadas por comas
+
+Responde SOLO con un JSON válido en el siguiente formato:
+{
+    "title": "Título del artículo",
+    "body": "Cuerpo completo del artículo con párrafos bien formateados...",
+    "seo_keywords": "palabra1, palabra2, palabra3, palabra4, palabra5"
+}
+
+No incluyas ningún texto adicional fuera del JSON."""
+
+SAMPLE_PROMPTS = [
+    "Beneficios del trabajo remoto para pequeñas empresas",
+    "Guía para principiantes de Python",
+    "Cómo preparar un huerto urbano en un balcón pequeño: plantas, riego y errores comunes",
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Comparar tokens de entrada por solicitud")
+    parser.add_argument("prompts", nargs="*", default=SAMPLE_PROMPTS)
+    parser.add_argument("--model", default=GEMINI_MODELS[0])
+    args = parser.parse_args()
+
+    if not GEMINI_API_KEY:
+        raise SystemExit("GEMINI_API_KEY no está configurada")
+
+    legacy_model = genai.GenerativeModel(args.model)
+    current_model = _get_model(args.model)
+    print(f"Modelo: {args.model}")
+    print(f"{'anterior':>9} {'actual':>7}  prompt")
+    totals = [0, 0]
+    for prompt in args.prompts:
+        legacy = legacy_model.count_tokens(f"{LEGACY_SYSTEM_PROMPT}\n\nPrompt del usuario: {prompt}").total_tokens
+        # count_tokens incluye la system_instruction configurada en el modelo
+        current = current_model.count_tokens(prompt).total_tokens
+        totals[0] += legacy
+        totals[1] += current
+        print(f"{legacy:>9} {current:>7}  {prompt[:60]}")
+    count = len(args.prompts)
+    print(f"Media: {totals[0] / count:.1f} -> {totals[1] / count:.1f} tokens de entrada")
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Date, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from database import Base
 
@@ -11,9 +11,13 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Contador de posts mantenido al insertar (evita COUNT(*) por petición)
+    post_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relación con posts
     posts = relationship("Post", back_populates="author")
+    # Contadores de consumo de tokens
+    usage = relationship("UserUsage", back_populates="user", uselist=False)
 
 
 class Post(Base):
@@ -23,6 +27,21 @@ class Post(Base):
     title = Column(String, nullable=False, index=True)
     body = Column(Text, nullable=False)
     seo_keywords = Column(Text, nullable=True)
+    # Cuerpo renderizado al guardar (ver render_service.py). Se cargan solo
+    # cuando se piden para no duplicar el tamaño de los listados
+    body_html = deferred(Column(Text, nullable=True), group="rendered")
+    body_toc = deferred(Column(Text, nullable=True), group="rendered")
+    reading_time_minutes = Column(Integer, nullable=True)
+    render_version = Column(Integer, nullable=True)
+    # Prompt original (sus bandas MinHash están en prompt_bands)
+    prompt = Column(Text, nullable=True)
+    # Consumo de la generación según los metadatos de uso de Gemini
+    model_name = Column(String, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    output_tokens = Column(Integer, nullable=True)
+    # Incluye los tokens de razonamiento; es lo que cuenta para el presupuesto
+    total_tokens = Column(Integer, nullable=True)
+    generation_ms = Column(Integer, nullable=True)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -30,4 +49,46 @@ class Post(Base):
     # Relación con usuario
     author = relationship("User", back_populates="posts")
 
+    __table_args__ = (
+        # Paginación por keyset de los posts de un autor
+        Index("ix_posts_author_created_id", "author_id", "created_at", "id"),
+        # Exportación incremental (since): un rango por columna
+        Index("ix_posts_created_at", "created_at"),
+        Index("ix_posts_updated_at", "updated_at"),
+    )
 
+
+class PromptBand(Base):
+    """
+    Bandas MinHash del prompt de cada post (ver prompt_index.py). Dos prompts
+    parecidos comparten alguna banda con alta probabilidad; buscar por
+    band_key devuelve los candidatos sin recorrer los posts.
+    """
+    __tablename__ = "prompt_bands"
+
+    band_key = Column(BigInteger, primary_key=True)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+
+class UserUsage(Base):
+    """
+    Contadores de tokens de Gemini por usuario. Se actualizan en cada
+    generación (día y mes UTC en curso y anteriores, ver usage_service.py)
+    para leerlos sin agregar.
+    """
+    __tablename__ = "user_usage"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, nullable=True)
+    day_tokens = Column(Integer, nullable=False, default=0, server_default="0")
+    # Consumo del día/mes anterior, para estimar las ventanas deslizantes
+    prev_day_tokens = Column(Integer, nullable=False, default=0, server_default="0")
+    day_requests = Column(Integer, nullable=False, default=0, server_default="0")
+    month = Column(Date, nullable=True)
+    month_tokens = Column(Integer, nullable=False, default=0, server_default="0")
+    prev_month_tokens = Column(Integer, nullable=False, default=0, server_default="0")
+    month_requests = Column(Integer, nullable=False, default=0, server_default="0")
+    total_tokens = Column(BigInteger, nullable=False, default=0, server_default="0")
+    total_requests = Column(Integer, nullable=False, default=0, server_default="0")
+
+    user = relationship("User", back_populates="usage")
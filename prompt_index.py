@@ -0,0 +1,207 @@
+"""
+Búsqueda de prompts parecidos (MinHash + LSH por bandas)
+
+Cada prompt se reduce a un conjunto de términos: minúsculas, sin acentos,
+sin palabras gramaticales (artículos, preposiciones, pronombres...) y con
+un stemming ligero ("companies" -> "company", "learning" -> "learn"); los
+textos CJK, sin espacios, se dividen en bigramas. La similitud entre dos
+prompts es el índice de Jaccard de sus conjuntos.
+
+La firma MinHash del conjunto (PROMPT_MINHASH_BANDS x PROMPT_MINHASH_ROWS
+valores) se divide en bandas y cada banda se guarda como un entero en la
+tabla prompt_bands. Dos prompts con Jaccard J comparten al menos una banda
+con probabilidad 1 - (1 - J^filas)^bandas: con 10 bandas de 3 filas es
+~91% para J = 0.6 y ~8% para J = 0.2. La búsqueda lee por índice los posts
+que comparten alguna banda y calcula el Jaccard exacto con sus prompts, así
+que su coste no depende del número de posts (~1 ms sobre 300.000, ver
+test_prompt_index.py). Las funciones son bloqueantes: desde código async se
+ejecutan en el threadpool.
+"""
+import hashlib
+import os
+import random
+import re
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func, select
+
+from models import Post, PromptBand
+
+# Jaccard mínimo entre los términos de dos prompts para considerarlos equivalentes
+PROMPT_SIMILARITY_THRESHOLD = float(os.getenv("PROMPT_SIMILARITY_THRESHOLD", "0.6"))
+# Qué hacer en /generate-post si ya existe un prompt parecido:
+# "offer" responde 409 con el post existente (se puede forzar con force=true),
+# "reuse" devuelve el post existente y "off" (por defecto) desactiva la búsqueda
+PROMPT_DEDUP_MODE = os.getenv("PROMPT_DEDUP_MODE", "off").lower()
+PROMPT_MINHASH_BANDS = 10
+PROMPT_MINHASH_ROWS = 3
+# Candidatos (los que comparten más bandas) cuyo prompt se compara por búsqueda
+PROMPT_MAX_CANDIDATES = 50
+
+# Palabras gramaticales, sin contenido propio
+_STOPWORDS = {
+    # Español
+    "a", "al", "ante", "como", "con", "de", "del", "desde", "e", "el", "en",
+    "entre", "es", "esta", "este", "hacia", "la", "las", "lo", "los", "mas",
+    "me", "mi", "mis", "muy", "ni", "o", "para", "pero", "por", "que", "se",
+    "sin", "sobre", "su", "sus", "te", "tu", "tus", "u", "un", "una", "unas",
+    "unos", "y", "yo",
+    # Inglés
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "i", "in",
+    "is", "it", "its", "me", "my", "of", "on", "or", "our", "so", "that",
+    "the", "their", "this", "to", "was", "we", "with", "you", "your",
+}
+
+_TOKEN_RE = re.compile(r"\w+")
+# Escrituras sin espacios entre palabras (chino, japonés)
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+# Permutaciones h -> (a * h + b) mod p, fijas para que las bandas guardadas
+# sigan siendo válidas entre procesos y reinicios
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240531)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(PROMPT_MINHASH_BANDS * PROMPT_MINHASH_ROWS)
+]
+_ROW_WEIGHTS = [_rng.randrange(1, _MERSENNE_PRIME) for _ in range(PROMPT_MINHASH_ROWS)]
+_BAND_SEEDS = [_rng.randrange(0, _MERSENNE_PRIME) for _ in range(PROMPT_MINHASH_BANDS)]
+
+
+def _stem(token: str) -> str:
+    # Plurales y sufijos frecuentes: "companies" -> "company", "boxes" -> "box",
+    # "beginners" -> "beginner", "learning" -> "learn", "quickly" -> "quick"
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ses", "xes", "zes", "ches", "shes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    if len(token) > 6 and token.endswith("ing"):
+        return token[:-3]
+    if len(token) > 6 and token.endswith("ly"):
+        return token[:-2]
+    return token
+
+
+def prompt_features(prompt: str) -> frozenset:
+    """Conjunto de términos normalizados del prompt (independiente del orden)."""
+    text = prompt.lower()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    features = set()
+    for token in _TOKEN_RE.findall(text):
+        if _CJK_RE.search(token):
+            if len(token) > 1:
+                features.update(token[i:i + 2] for i in range(len(token) - 1))
+            else:
+                features.add(token)
+        elif token not in _STOPWORDS:
+            features.add(_stem(token))
+    return frozenset(features)
+
+
+@lru_cache(maxsize=65536)
+def _feature_minhashes(feature: str) -> tuple:
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+    return tuple((a * h + b) % _MERSENNE_PRIME for a, b in _PERMUTATIONS)
+
+
+def _band_key(band: int, values) -> int:
+    # Combinación lineal de las filas de la banda módulo p: cabe en BIGINT
+    key = _BAND_SEEDS[band]
+    for value, weight in zip(values, _ROW_WEIGHTS):
+        key = (key + value * weight) % _MERSENNE_PRIME
+    return key
+
+
+class PromptSignature(NamedTuple):
+    features: frozenset
+    band_keys: tuple
+
+
+def prompt_signature(prompt: str) -> Optional[PromptSignature]:
+    """
+    Términos y bandas MinHash del prompt, o None si no tiene ningún término
+    (solo palabras gramaticales): esos prompts nunca se comparan.
+    """
+    features = prompt_features(prompt)
+    if not features:
+        return None
+    signature = list(map(min, zip(*map(_feature_minhashes, features))))
+    rows = PROMPT_MINHASH_ROWS
+    band_keys = tuple(
+        _band_key(band, signature[band * rows:(band + 1) * rows])
+        for band in range(PROMPT_MINHASH_BANDS)
+    )
+    return PromptSignature(features, band_keys)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def find_similar(
+    db, signature: PromptSignature, threshold: float = PROMPT_SIMILARITY_THRESHOLD
+) -> Optional[tuple]:
+    """
+    Retorna (post_id, similitud) del post con el prompt más parecido con
+    similitud >= threshold, o None. Ante empate prefiere el post más antiguo.
+    """
+    shared_bands = func.count().label("shared_bands")
+    candidates = db.execute(
+        select(PromptBand.post_id)
+        .where(PromptBand.band_key.in_(signature.band_keys))
+        .group_by(PromptBand.post_id)
+        .order_by(shared_bands.desc(), PromptBand.post_id)
+        .limit(PROMPT_MAX_CANDIDATES)
+    ).scalars().all()
+    if not candidates:
+        return None
+    best = None
+    for post_id, prompt in db.execute(select(Post.id, Post.prompt).where(Post.id.in_(candidates))):
+        similarity = jaccard(signature.features, prompt_features(prompt or ""))
+        if similarity >= threshold and (best is None or (-similarity, post_id) < best):
+            best = (-similarity, post_id)
+    if best is None:
+        return None
+    return best[1], -best[0]
+
+
+def index_prompt(db, post_id: int, signature: PromptSignature):
+    """Agrega las bandas del post a la sesión (se guardan con su commit)."""
+    db.add_all(PromptBand(band_key=key, post_id=post_id) for key in set(signature.band_keys))
+
+
+def backfill_prompt_bands(db, batch_size: int = 1000) -> int:
+    """
+    Calcula las bandas de los posts con prompt que aún no las tienen (los
+    creados antes de esta tabla). Retorna el número de posts indexados.
+    """
+    indexed = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Post.id, Post.prompt)
+            .where(
+                Post.id > last_id,
+                Post.prompt.isnot(None),
+                ~select(PromptBand.post_id).where(PromptBand.post_id == Post.id).exists(),
+            )
+            .order_by(Post.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return indexed
+        for post_id, prompt in rows:
+            signature = prompt_signature(prompt)
+            if signature is not None:
+                index_prompt(db, post_id, signature)
+                indexed += 1
+        last_id = rows[-1][0]
+        db.commit()
@@ -0,0 +1,283 @@
+"""
+Rate limiting por cliente y control de admisión (load shedding)
+
+- Token bucket por IP para peticiones anónimas y por usuario (JWT) para las
+  autenticadas; `/token` usa un bucket más estricto por IP contra fuerza bruta.
+  Al agotarse responde 429 con `Retry-After`.
+- Si el event loop acumula retraso o la espera por una conexión del pool supera
+  los umbrales, las lecturas anónimas se rechazan con 503 y `Retry-After`, para
+  que los usuarios autenticados mantengan latencias bajas.
+
+Con RATE_LIMIT_BACKEND=memory los buckets se guardan en memoria del proceso;
+con sqlite se comparten entre los workers de la máquina mediante un archivo
+SQLite (gunicorn_conf.py lo activa cuando hay varios workers). Para
+compartirlos entre instancias, implementa RateLimitBackend (ej: con Redis) y
+pásalo a RateLimitMiddleware.
+"""
+import asyncio
+import ipaddress
+import logging
+import math
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from jose import JWTError, jwt
+from starlette.responses import JSONResponse
+
+import shared_store
+from auth import SECRET_KEY, ALGORITHM
+from database import get_pool_wait_seconds
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Peticiones por minuto y ráfaga máxima de cada tipo de bucket
+RATE_LIMIT_ANON_PER_MINUTE = float(os.getenv("RATE_LIMIT_ANON_PER_MINUTE", "60"))
+RATE_LIMIT_ANON_BURST = float(os.getenv("RATE_LIMIT_ANON_BURST", "30"))
+RATE_LIMIT_USER_PER_MINUTE = float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", "300"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "60"))
+RATE_LIMIT_LOGIN_PER_MINUTE = float(os.getenv("RATE_LIMIT_LOGIN_PER_MINUTE", "10"))
+RATE_LIMIT_LOGIN_BURST = float(os.getenv("RATE_LIMIT_LOGIN_BURST", "5"))
+
+# Almacén de buckets: "memory" (por proceso) o "sqlite" (compartido en la máquina)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH") or shared_store.SHARED_STATE_PATH
+# Proxies de confianza delante de la app (Render: 1). La IP del cliente es la
+# entrada de X-Forwarded-For que añadió el último de ellos; las anteriores las
+# controla el cliente. Con 0 se usa la IP de la conexión
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0"))
+
+# Un bucket inactivo más tiempo que esto ya está lleno (equivale a uno nuevo)
+BUCKET_IDLE_SECONDS = 300
+
+# Umbrales de load shedding (0 desactiva cada criterio)
+LOAD_SHED_LOOP_LAG_MS = float(os.getenv("LOAD_SHED_LOOP_LAG_MS", "250"))
+LOAD_SHED_POOL_WAIT_MS = float(os.getenv("LOAD_SHED_POOL_WAIT_MS", "500"))
+LOAD_SHED_RETRY_AFTER = int(os.getenv("LOAD_SHED_RETRY_AFTER", "2"))
+LOOP_LAG_INTERVAL = 0.25
+
+# Rutas que nunca se limitan
+EXEMPT_PATHS = {"/", "/health", "/docs", "/redoc", "/openapi.json"}
+
+
+logger = logging.getLogger("rate_limit")
+
+
+def _take_token(bucket, now: float, rate: float, burst: float):
+    """Retorna (segundos a esperar o 0, tokens restantes) tras consumir un token."""
+    if bucket is None:
+        tokens = burst
+    else:
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+    if tokens >= 1:
+        return 0.0, tokens - 1
+    return (1 - tokens) / rate, tokens
+
+
+class RateLimitBackend:
+    """Almacén de token buckets. Las implementaciones compartidas deben ser atómicas."""
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """
+        Consume un token del bucket `key` (rate en tokens/segundo).
+        Retorna 0 si se permite la petición, o los segundos a esperar.
+        """
+        raise NotImplementedError
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    Token buckets en memoria del proceso. Con más de `max_keys` claves se
+    descartan las usadas hace más tiempo (LRU): un bucket en uso, como el de
+    login de quien está probando contraseñas, nunca es el primero en salir.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        # pop + insertar deja la clave al final (la más reciente)
+        bucket = self._buckets.pop(key, None)
+        while len(self._buckets) >= self.max_keys:
+            self._buckets.popitem(last=False)
+        wait, tokens = _take_token(bucket, now, rate, burst)
+        self._buckets[key] = (tokens, now)
+        return wait
+
+
+class SqliteRateLimitBackend(RateLimitBackend):
+    """
+    Token buckets en un archivo SQLite compartido por todos los workers de la
+    máquina (ver shared_store.py). Cada operación es una transacción corta,
+    pero puede esperar el bloqueo de otro worker: se ejecuta en un pool de
+    hilos propio (no en el event loop ni en el threadpool de la app) y, si el
+    bloqueo no se libera en SHARED_STATE_BUSY_TIMEOUT, la petición pasa.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB_PATH, prune_every: int = 1000, threads: int = 2):
+        self.path = path
+        self.prune_every = prune_every
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="rate-limit")
+        self._ops = 0
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._take, key, rate, burst)
+        except sqlite3.Error as e:
+            # Si el almacén falla o está bloqueado se deja pasar la petición
+            # en vez de esperar o responder 500
+            logger.warning("Rate limiting no disponible: %s", e)
+            return 0.0
+
+    def _take(self, key: str, rate: float, burst: float) -> float:
+        conn = shared_store.connection(self.path)
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            bucket = conn.execute(
+                "SELECT tokens, at FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            wait, tokens = _take_token(bucket, now, rate, burst)
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, at = excluded.at",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._ops += 1
+        if self._ops % self.prune_every == 0:
+            # Fuera de la transacción del bucket y acotado: recorre el índice
+            # de `at` y borra como mucho 500 buckets inactivos por vez
+            conn.execute(
+                "DELETE FROM buckets WHERE key IN "
+                "(SELECT key FROM buckets WHERE at < ? LIMIT 500)",
+                (now - BUCKET_IDLE_SECONDS,),
+            )
+        return wait
+
+
+def default_backend() -> RateLimitBackend:
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SqliteRateLimitBackend()
+    return MemoryRateLimitBackend()
+
+
+class LoopLagMonitor:
+    """Mide el retraso del event loop comparando sleeps con el tiempo real."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.lag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - start - self.interval)
+            # Subir rápido y bajar suave
+            self.lag = lag if lag > self.lag else 0.7 * self.lag + 0.3 * lag
+
+
+def _rate_limit_ip(ip: str) -> str:
+    # Una conexión IPv6 suele disponer de un /64 completo: limitar por prefijo
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip
+    if address.version == 6:
+        if address.ipv4_mapped:
+            return str(address.ipv4_mapped)
+        return str(ipaddress.ip_network(f"{address}/64", strict=False))
+    return str(address)
+
+
+def _client_ip(scope, headers: dict) -> str:
+    client = scope.get("client")
+    ip = client[0] if client else "unknown"
+    if RATE_LIMIT_PROXY_HOPS:
+        forwarded = [
+            part.strip()
+            for part in headers.get(b"x-forwarded-for", b"").decode("latin-1").split(",")
+            if part.strip()
+        ]
+        if len(forwarded) >= RATE_LIMIT_PROXY_HOPS:
+            ip = forwarded[-RATE_LIMIT_PROXY_HOPS]
+    return _rate_limit_ip(ip)
+
+
+def _user_from_token(headers: dict) -> Optional[str]:
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        payload = jwt.decode(authorization[7:].strip(), SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
+class RateLimitMiddleware:
+    """Middleware ASGI de rate limiting y load shedding."""
+
+    def __init__(self, app, backend: Optional[RateLimitBackend] = None):
+        self.app = app
+        self.backend = backend or default_backend()
+        self.loop_monitor = LoopLagMonitor()
+
+    def overloaded(self) -> bool:
+        if LOAD_SHED_LOOP_LAG_MS and self.loop_monitor.lag * 1000 > LOAD_SHED_LOOP_LAG_MS:
+            return True
+        if LOAD_SHED_POOL_WAIT_MS and get_pool_wait_seconds() * 1000 > LOAD_SHED_POOL_WAIT_MS:
+            return True
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if not RATE_LIMIT_ENABLED or scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        self.loop_monitor.start()
+
+        headers = dict(scope["headers"])
+        ip = _client_ip(scope, headers)
+        user = _user_from_token(headers)
+
+        if scope["path"] == "/token":
+            key, rate, burst = f"login:{ip}", RATE_LIMIT_LOGIN_PER_MINUTE, RATE_LIMIT_LOGIN_BURST
+        elif user:
+            key, rate, burst = f"user:{user}", RATE_LIMIT_USER_PER_MINUTE, RATE_LIMIT_USER_BURST
+        else:
+            key, rate, burst = f"ip:{ip}", RATE_LIMIT_ANON_PER_MINUTE, RATE_LIMIT_ANON_BURST
+
+        retry_after = await self.backend.take(key, rate / 60, burst)
+        if retry_after:
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Demasiadas solicitudes. Intenta de nuevo más tarde."},
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+            await response(scope, receive, send)
+            return
+
+        if user is None and scope["method"] == "GET" and self.overloaded():
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Servidor sobrecargado. Intenta de nuevo en unos segundos."},
+                headers={"Retry-After": str(LOAD_SHED_RETRY_AFTER)},
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
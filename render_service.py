@@ -0,0 +1,85 @@
+"""
+Renderizado del cuerpo de los posts (Markdown -> HTML sanitizado)
+
+El cuerpo se normaliza y se renderiza una sola vez al guardarlo. Junto al
+texto original se guardan el HTML, la tabla de contenidos y el tiempo de
+lectura. RENDER_VERSION se incrementa al cambiar el renderizador;
+rerender_posts.py actualiza solo los posts con una versión anterior.
+"""
+import json
+import re
+
+import markdown
+import nh3
+from markdown.extensions.toc import slugify_unicode
+
+# Incrementar al cambiar la normalización, las extensiones o la sanitización
+RENDER_VERSION = 1
+
+# Palabras por minuto para estimar el tiempo de lectura
+WORDS_PER_MINUTE = 200
+
+_MARKDOWN_EXTENSIONS = ["extra", "sane_lists", "toc"]
+_MARKDOWN_CONFIG = {"toc": {"slugify": slugify_unicode}}
+
+_ALLOWED_TAGS = {
+    "a", "abbr", "b", "blockquote", "br", "code", "dd", "del", "dl", "dt", "em",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "li", "ol", "p", "pre", "s",
+    "strong", "sub", "sup", "table", "tbody", "td", "th", "thead", "tr", "ul",
+}
+_ALLOWED_ATTRIBUTES = {
+    "a": {"href", "title"},
+    "abbr": {"title"},
+    "h1": {"id"}, "h2": {"id"}, "h3": {"id"}, "h4": {"id"}, "h5": {"id"}, "h6": {"id"},
+    "td": {"align"}, "th": {"align"},
+}
+
+_WORD_RE = re.compile(r"\w+")
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def normalize_body(body: str) -> str:
+    """
+    Unifica el formato de los cuerpos que devuelve Gemini: saltos de línea
+    escapados o de Windows, espacios finales y líneas en blanco repetidas.
+    """
+    text = body.replace("\r\n", "\n").replace("\r", "\n")
+    # Algunas respuestas llegan con "\n" literales en vez de saltos de línea
+    if "\n" not in text and "\\n" in text:
+        text = text.replace("\\n", "\n")
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def _flatten_toc(tokens: list) -> list:
+    entries = []
+    for token in tokens:
+        entries.append({"level": token["level"], "id": token["id"], "text": token["name"]})
+        entries.extend(_flatten_toc(token["children"]))
+    return entries
+
+
+def render_body(body: str) -> dict:
+    """
+    Retorna body_html (sanitizado), body_toc (JSON con level/id/text de cada
+    encabezado), reading_time_minutes y render_version.
+    """
+    text = normalize_body(body)
+    md = markdown.Markdown(extensions=_MARKDOWN_EXTENSIONS, extension_configs=_MARKDOWN_CONFIG)
+    html = md.convert(text)
+    safe_html = nh3.clean(
+        html,
+        tags=_ALLOWED_TAGS,
+        attributes=_ALLOWED_ATTRIBUTES,
+        url_schemes={"http", "https", "mailto"},
+        link_rel="noopener noreferrer nofollow",
+    )
+    toc = _flatten_toc(md.toc_tokens)
+    words = len(_WORD_RE.findall(_TAG_RE.sub(" ", safe_html)))
+    return {
+        "body_html": safe_html,
+        "body_toc": json.dumps(toc, ensure_ascii=False),
+        "reading_time_minutes": max(1, round(words / WORDS_PER_MINUTE)),
+        "render_version": RENDER_VERSION,
+    }
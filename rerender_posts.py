@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Re-renderiza el HTML, la tabla de contenidos y el tiempo de lectura de los
+posts cuya render_version es anterior a render_service.RENDER_VERSION
+
+Uso:
+    python rerender_posts.py [--batch-size 200]
+
+Procesa los posts por lotes ordenados por id y hace commit de cada lote, así
+que se puede interrumpir y volver a ejecutar: solo toca los pendientes.
+"""
+import argparse
+import time
+
+from sqlalchemy import or_
+
+from database import SessionLocal
+from models import Post
+from render_service import RENDER_VERSION, render_body
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-renderizar posts desactualizados")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"Re-renderizando posts a la versión {RENDER_VERSION}...")
+    start = time.monotonic()
+    total = 0
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while True:
+            posts = (
+                db.query(Post)
+                .filter(
+                    Post.id > last_id,
+                    or_(Post.render_version.is_(None), Post.render_version < RENDER_VERSION)
+                )
+                .order_by(Post.id)
+                .limit(args.batch_size)
+                .all()
+            )
+            if not posts:
+                break
+            for post in posts:
+                for field, value in render_body(post.body).items():
+                    setattr(post, field, value)
+            db.commit()
+            total += len(posts)
+            last_id = posts[-1].id
+            print(f"  {total} posts actualizados (último id: {last_id})")
+    finally:
+        db.close()
+
+    print(f"✓ {total} posts re-renderizados en {time.monotonic() - start:.1f}s")
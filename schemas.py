@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field
+from datetime import date, datetime
 from typing import Optional
 
 
@@ -13,6 +13,7 @@ class UserResponse(BaseModel):
     id: int
     email: str
     created_at: datetime
+    post_count: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -29,8 +30,15 @@ class TokenData(BaseModel):
 
 
 # Schemas para Posts
+# Límite duro de caracteres del prompt; el presupuesto de tokens lo aplica
+# gemini_service.fit_prompt (GEMINI_MAX_PROMPT_TOKENS)
+PROMPT_MAX_CHARS = 20000
+
+
 class PostGenerate(BaseModel):
-    prompt: str
+    prompt: str = Field(max_length=PROMPT_MAX_CHARS)
+    # Generar aunque exista un post con un prompt muy parecido
+    force: bool = False
 
 
 class PostResponse(BaseModel):
@@ -41,14 +49,55 @@ class PostResponse(BaseModel):
     author_id: int
     created_at: datetime
     updated_at: Optional[datetime]
+    reading_time_minutes: Optional[int] = None
 
     class Config:
         from_attributes = True
 
 
+class TocEntry(BaseModel):
+    level: int
+    id: str
+    text: str
+
+
+class PostHtmlResponse(PostResponse):
+    body_html: str
+    toc: list[TocEntry]
+
+
+class UsageResponse(BaseModel):
+    day: date
+    day_tokens: int
+    day_requests: int
+    daily_budget: Optional[int]
+    month: date
+    month_tokens: int
+    month_requests: int
+    monthly_budget: Optional[int]
+    total_tokens: int
+    total_requests: int
+
+
+class PostPage(BaseModel):
+    items: list[PostResponse]
+    next_cursor: Optional[str] = None
+
+
 class PostCreate(BaseModel):
     title: str
     body: str
     seo_keywords: Optional[str] = None
+    # Opcionales para importaciones/restauraciones (ver import_service.py)
+    author_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+
+class ImportReport(BaseModel):
+    rows_imported: int
+    rows_failed: int
+    seconds: float
+    rows_per_second: Optional[float]
+    errors: list[dict]
 
 
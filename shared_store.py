@@ -0,0 +1,51 @@
+"""
+Estado compartido entre los workers de una máquina
+
+Un archivo SQLite en /dev/shm (tmpfs: vive en memoria y no se sincroniza a
+disco) que usan el rate limiting (tabla buckets) y las lecturas al primario
+tras escribir (tabla sticky_reads). Cada hilo de cada proceso abre su propia
+conexión. Las operaciones son transacciones cortas con un busy timeout
+pequeño: si el archivo está bloqueado, quien llama debe seguir sin el estado
+compartido en lugar de esperar.
+
+Las funciones de este módulo son bloqueantes: desde código async deben
+ejecutarse en el threadpool.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+    f"blog-shared-state-{os.getuid() if hasattr(os, 'getuid') else 0}.db",
+)
+# Espera máxima por el bloqueo de escritura de otro worker (segundos)
+SHARED_STATE_BUSY_TIMEOUT = float(os.getenv("SHARED_STATE_BUSY_TIMEOUT", "0.05"))
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS buckets "
+    "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_buckets_at ON buckets (at)",
+    "CREATE TABLE IF NOT EXISTS sticky_reads (key TEXT PRIMARY KEY, until REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_sticky_reads_until ON sticky_reads (until)",
+]
+
+_local = threading.local()
+
+
+def connection(path: str = SHARED_STATE_PATH) -> sqlite3.Connection:
+    """Conexión del hilo actual (se abre de nuevo tras un fork)."""
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=SHARED_STATE_BUSY_TIMEOUT, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        connections[path] = conn
+    return conn
@@ -0,0 +1,48 @@
+"""
+Pruebas del detector de bloqueos del event loop en modo estricto
+
+Ejecutar con:
+    python -m pytest test_loop_watchdog.py
+"""
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from loop_watchdog import LoopBlockedError, LoopWatchdog, LoopWatchdogMiddleware
+
+
+def create_app(watchdog: LoopWatchdog) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(LoopWatchdogMiddleware, watchdog=watchdog)
+
+    @app.get("/blocking")
+    async def blocking():
+        time.sleep(0.12)
+        return {"ok": True}
+
+    @app.get("/awaiting")
+    async def awaiting():
+        await asyncio.sleep(0.12)
+        return {"ok": True}
+
+    return app
+
+
+def test_strict_mode_fails_blocking_handler():
+    watchdog = LoopWatchdog(threshold_ms=50, strict=True)
+    with TestClient(create_app(watchdog)) as client:
+        with pytest.raises(LoopBlockedError) as error:
+            client.get("/blocking")
+    assert "GET /blocking" in str(error.value)
+    assert "time.sleep" in str(error.value)
+    assert watchdog.stats()["by_route"]["GET /blocking"]["count"] == 1
+
+
+def test_strict_mode_allows_awaiting_handler():
+    watchdog = LoopWatchdog(threshold_ms=50, strict=True)
+    with TestClient(create_app(watchdog)) as client:
+        assert client.get("/awaiting").status_code == 200
+    assert watchdog.stats()["blocks"] == 0
@@ -0,0 +1,101 @@
+"""
+Pruebas de la búsqueda de prompts parecidos (MinHash + LSH)
+
+Ejecutar con:
+    python -m pytest test_prompt_index.py
+"""
+import random
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import upgrade_schema
+from models import Post, User
+from prompt_index import find_similar, index_prompt, prompt_signature
+
+PARAPHRASES = [
+    ("python for beginners", "python for absolute beginners"),
+    ("remote work benefits for small companies", "remote work benefits for small businesses"),
+    ("tips for learning spanish quickly", "quick tips to learn spanish"),
+    ("Escribe sobre los beneficios del trabajo remoto", "beneficios del trabajo remoto"),
+]
+UNRELATED = [
+    ("python for beginners", "java for beginners"),
+    ("remote work benefits for small companies", "drawbacks of remote work"),
+    ("tips for learning spanish quickly", "history of the spanish civil war"),
+]
+
+
+def create_session():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    upgrade_schema(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(User(id=1, email="autor@example.com", hashed_password="x"))
+    db.commit()
+    return db
+
+
+def add_post(db, prompt: str) -> int:
+    post = Post(title=prompt, body=prompt, prompt=prompt, author_id=1)
+    db.add(post)
+    db.flush()
+    index_prompt(db, post.id, prompt_signature(prompt))
+    db.commit()
+    return post.id
+
+
+@pytest.mark.parametrize("stored, query", PARAPHRASES)
+def test_finds_paraphrase(stored, query):
+    db = create_session()
+    post_id = add_post(db, stored)
+    match = find_similar(db, prompt_signature(query))
+    assert match is not None and match[0] == post_id
+
+
+@pytest.mark.parametrize("stored, query", UNRELATED)
+def test_rejects_unrelated_prompt(stored, query):
+    db = create_session()
+    add_post(db, stored)
+    assert find_similar(db, prompt_signature(query)) is None
+
+
+def test_prompt_without_terms_has_no_signature():
+    assert prompt_signature("sobre la de los") is None
+
+
+def test_lookup_time_with_300k_prompts():
+    db = create_session()
+    rng = random.Random(1)
+    vocabulary = [f"term{i}" for i in range(20000)]
+    prompts = [" ".join(rng.sample(vocabulary, rng.randint(3, 8))) for _ in range(300_000)]
+    connection = db.connection()
+    connection.exec_driver_sql(
+        "INSERT INTO posts (id, title, body, prompt, author_id) VALUES (?, 't', 'b', ?, 1)",
+        list(enumerate(prompts, start=1)),
+    )
+    connection.exec_driver_sql(
+        "INSERT INTO prompt_bands (band_key, post_id) VALUES (?, ?)",
+        [
+            (key, post_id)
+            for post_id, prompt in enumerate(prompts, start=1)
+            for key in set(prompt_signature(prompt).band_keys)
+        ],
+    )
+    db.commit()
+    stored_ids = [add_post(db, stored) for stored, _ in PARAPHRASES]
+
+    for post_id, (_, query) in zip(stored_ids, PARAPHRASES):
+        assert find_similar(db, prompt_signature(query))[0] == post_id
+
+    queries = [prompts[i] + " guide" for i in range(0, 300_000, 1500)]
+    started = time.perf_counter()
+    for query in queries:
+        find_similar(db, prompt_signature(query))
+    per_lookup = (time.perf_counter() - started) / len(queries)
+    # ~1 ms en SQLite en memoria; el margen cubre máquinas lentas
+    assert per_lookup < 0.005
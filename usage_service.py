@@ -0,0 +1,213 @@
+"""
+Contabilidad de tokens de Gemini por usuario y presupuestos diarios/mensuales
+
+Los presupuestos se aplican sobre ventanas deslizantes aproximadas: la fila
+guarda el consumo del día (y del mes) UTC en curso y el del anterior, y el
+consumo de las últimas 24 horas se estima como
+    anterior x (fracción del día que falta) + actual
+(igual para el mes). Así no se puede gastar el presupuesto dos veces seguidas
+al cruzar la medianoche, como pasaría con contadores que se reinician, sin
+guardar cada generación. La estimación supone que el consumo del día anterior
+fue uniforme.
+
+Antes de llamar a Gemini se reserva una estimación de los tokens con un
+UPDATE condicional (solo si cabe en el presupuesto), de modo que las
+peticiones concurrentes no pueden superarlo entre todas; después se ajusta
+con el consumo real (o se devuelve la reserva si la generación falla).
+"""
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import case, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import UserUsage
+
+# Presupuestos de tokens por usuario (0 = sin límite)
+DAILY_TOKEN_BUDGET = int(os.getenv("DAILY_TOKEN_BUDGET", "0"))
+MONTHLY_TOKEN_BUDGET = int(os.getenv("MONTHLY_TOKEN_BUDGET", "0"))
+# Tokens de salida (incluido el razonamiento) que se reservan por generación,
+# además de los del prompt, hasta conocer el consumo real
+BUDGET_OUTPUT_RESERVE_TOKENS = int(os.getenv("BUDGET_OUTPUT_RESERVE_TOKENS", "2000"))
+
+
+class _Periods:
+    """Día y mes UTC en curso y anteriores, y el peso de los anteriores."""
+
+    def __init__(self, now: Optional[datetime] = None):
+        now = now or datetime.now(timezone.utc)
+        self.today = now.date()
+        self.yesterday = self.today - timedelta(days=1)
+        self.month = self.today.replace(day=1)
+        self.prev_month = (self.month - timedelta(days=1)).replace(day=1)
+        next_month = (self.month + timedelta(days=32)).replace(day=1)
+        midnight = datetime.combine(self.today, datetime.min.time(), tzinfo=timezone.utc)
+        month_start = datetime.combine(self.month, datetime.min.time(), tzinfo=timezone.utc)
+        month_seconds = (next_month - self.month).total_seconds()
+        self.day_weight = 1 - (now - midnight).total_seconds() / 86400
+        self.month_weight = 1 - (now - month_start).total_seconds() / month_seconds
+
+
+def _window(period: Optional[date], tokens: int, prev_tokens: int, current: date, previous: date, weight: float):
+    """Consumo estimado de la ventana deslizante a partir de los contadores guardados."""
+    if period == current:
+        return prev_tokens * weight + tokens
+    if period == previous:
+        return tokens * weight
+    return 0
+
+
+def get_usage(db: Session, user_id: int) -> UserUsage:
+    """Obtiene (o crea) la fila de contadores del usuario."""
+    usage = db.get(UserUsage, user_id)
+    if usage is None:
+        usage = UserUsage(user_id=user_id)
+        db.add(usage)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Otro proceso creó la fila al mismo tiempo
+            db.rollback()
+            usage = db.get(UserUsage, user_id)
+        else:
+            db.refresh(usage)
+    return usage
+
+
+def usage_summary(usage: UserUsage) -> dict:
+    """
+    Consumo estimado de las últimas 24 horas y del último mes (ventanas
+    deslizantes, ver arriba). Las solicitudes son las del día y mes UTC en curso.
+    """
+    periods = _Periods()
+    return {
+        "day": periods.today,
+        "day_tokens": round(_window(
+            usage.day, usage.day_tokens, usage.prev_day_tokens,
+            periods.today, periods.yesterday, periods.day_weight,
+        )),
+        "day_requests": usage.day_requests if usage.day == periods.today else 0,
+        "daily_budget": DAILY_TOKEN_BUDGET or None,
+        "month": periods.month,
+        "month_tokens": round(_window(
+            usage.month, usage.month_tokens, usage.prev_month_tokens,
+            periods.month, periods.prev_month, periods.month_weight,
+        )),
+        "month_requests": usage.month_requests if usage.month == periods.month else 0,
+        "monthly_budget": MONTHLY_TOKEN_BUDGET or None,
+        "total_tokens": usage.total_tokens,
+        "total_requests": usage.total_requests,
+    }
+
+
+def budget_exceeded(usage: UserUsage, tokens: int = 0) -> Optional[str]:
+    """
+    Retorna un mensaje si el usuario agotó su presupuesto diario o mensual, o
+    si lo que le queda no alcanza para reservar `tokens`.
+    """
+    summary = usage_summary(usage)
+    windows = (
+        ("las últimas 24 horas", "del día", summary["day_tokens"], DAILY_TOKEN_BUDGET),
+        ("el último mes", "del mes", summary["month_tokens"], MONTHLY_TOKEN_BUDGET),
+    )
+    for window, span, used, budget in windows:
+        if not budget:
+            continue
+        if used >= budget:
+            return (
+                f"Has agotado tu presupuesto de {budget} tokens para {window}. "
+                f"Se libera de forma gradual a lo largo {span}."
+            )
+        if used + tokens > budget:
+            return (
+                f"Te quedan unos {budget - used} tokens de tu presupuesto para {window} "
+                f"y cada generación reserva unos {tokens}. Intenta de nuevo más tarde."
+            )
+    return None
+
+
+def _non_negative(expression):
+    return case((expression < 0, 0), else_=expression)
+
+
+def _charge(db: Session, user_id: int, tokens: int, requests: int, total_tokens: int, limit: bool = False) -> bool:
+    """
+    Suma `tokens` a los contadores del usuario con un único UPDATE atómico,
+    pasando a "anterior" las ventanas que hayan terminado. Con limit=True solo
+    se aplica si el consumo resultante cabe en los presupuestos. Retorna si
+    se aplicó. No hace commit.
+    """
+    periods = _Periods()
+    same_day = UserUsage.day == periods.today
+    same_month = UserUsage.month == periods.month
+    day_tokens = _non_negative(case((same_day, UserUsage.day_tokens + tokens), else_=tokens))
+    prev_day_tokens = case(
+        (same_day, UserUsage.prev_day_tokens),
+        (UserUsage.day == periods.yesterday, UserUsage.day_tokens),
+        else_=0,
+    )
+    month_tokens = _non_negative(case((same_month, UserUsage.month_tokens + tokens), else_=tokens))
+    prev_month_tokens = case(
+        (same_month, UserUsage.prev_month_tokens),
+        (UserUsage.month == periods.prev_month, UserUsage.month_tokens),
+        else_=0,
+    )
+    statement = (
+        update(UserUsage)
+        .where(UserUsage.user_id == user_id)
+        .values(
+            day_tokens=day_tokens,
+            prev_day_tokens=prev_day_tokens,
+            day_requests=case((same_day, UserUsage.day_requests + requests), else_=requests),
+            month_tokens=month_tokens,
+            prev_month_tokens=prev_month_tokens,
+            month_requests=case((same_month, UserUsage.month_requests + requests), else_=requests),
+            total_tokens=UserUsage.total_tokens + total_tokens,
+            total_requests=UserUsage.total_requests + requests,
+            day=periods.today,
+            month=periods.month,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if limit and DAILY_TOKEN_BUDGET:
+        statement = statement.where(
+            prev_day_tokens * periods.day_weight + day_tokens <= DAILY_TOKEN_BUDGET
+        )
+    if limit and MONTHLY_TOKEN_BUDGET:
+        statement = statement.where(
+            prev_month_tokens * periods.month_weight + month_tokens <= MONTHLY_TOKEN_BUDGET
+        )
+    return db.execute(statement).rowcount == 1
+
+
+def reserve_usage(db: Session, user_id: int, tokens: int) -> Optional[str]:
+    """
+    Reserva `tokens` del presupuesto antes de llamar a Gemini, solo si caben
+    (UPDATE condicional: dos peticiones concurrentes no pueden usar el mismo
+    margen). Hace commit. Retorna None si se reservó o el mensaje de error.
+    """
+    get_usage(db, user_id)
+    if _charge(db, user_id, tokens, requests=0, total_tokens=0, limit=True):
+        db.commit()
+        return None
+    db.rollback()
+    usage = db.get(UserUsage, user_id)
+    db.refresh(usage)
+    return budget_exceeded(usage, tokens) or (
+        "No queda presupuesto de tokens para esta generación. Intenta de nuevo más tarde."
+    )
+
+
+def release_usage(db: Session, user_id: int, reserved: int):
+    """Devuelve una reserva cuya generación falló. No hace commit."""
+    _charge(db, user_id, -reserved, requests=0, total_tokens=0)
+
+
+def record_usage(db: Session, user_id: int, tokens: int, reserved: int = 0):
+    """
+    Registra el consumo real de una generación, descontando lo que se
+    reservó para ella. No hace commit.
+    """
+    _charge(db, user_id, tokens - reserved, requests=1, total_tokens=tokens)
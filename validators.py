@@ -10,6 +10,10 @@ from dotenv import load_dotenv
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Con GEMINI_VALIDATE_ON_STARTUP=false el arranque no llama a list_models.
+# gunicorn_conf.py lo desactiva porque con preload_app esa llamada crearía un
+# cliente gRPC en el proceso maestro, que los workers heredarían al hacer fork
+GEMINI_VALIDATE_ON_STARTUP = os.getenv("GEMINI_VALIDATE_ON_STARTUP", "true").lower() == "true"
 
 
 def validate_database_connection(engine):
@@ -44,9 +48,10 @@ def validate_database_connection(engine):
         return False, f"Error inesperado al validar la base de datos: {str(e)}"
 
 
-def validate_gemini_api():
+def validate_gemini_api(remote: bool = True):
     """
     Valida la configuración de la API de Gemini sin hacer solicitudes reales.
+    Con remote=False solo revisa la API key, sin llamar a list_models.
     Retorna (success: bool, message: str)
     """
     if not GEMINI_API_KEY:
@@ -58,6 +63,8 @@ def validate_gemini_api():
     try:
         # Configurar Gemini (no hace solicitud real, solo configuración)
         genai.configure(api_key=GEMINI_API_KEY)
+        if not remote:
+            return True, "API Key configurada. La validación completa se realizará al generar contenido."
         
         # Intentar listar modelos disponibles (no consume cuota de generación)
         # Esto verifica que la API key sea válida sin hacer solicitudes de contenido